@@ -0,0 +1,191 @@
+"""
+batch simulation for pac man
+
+runs many independent games at once, stored as numpy arrays.
+The rules are the same as in pacman.Simulation (player step, pill eating,
+ghost movement with random choice at junctions, player/ghost collision),
+but one call of step() advances all games in one vectorized tick.
+Ghosts are still moved one after another (ghost 0, ghost 1, ...) inside each
+game, because a ghost may not enter a cell occupied by another ghost.
+
+part of http://ThePythonGamebook.com
+"""
+
+import numpy as np
+
+from pacman import Game, Level, Maze, Simulation
+
+# directions in the same order as Simulation.nesw: north, east, south, west
+DIRECTIONS = tuple(Simulation.nesw.keys())
+DX = np.array([Simulation.nesw[d][0] for d in DIRECTIONS], dtype=np.int32)
+DY = np.array([Simulation.nesw[d][1] for d in DIRECTIONS], dtype=np.int32)
+BITS = np.array([Maze.bits[d] for d in DIRECTIONS], dtype=np.uint8)
+NONE = -1  # action: player waits
+
+
+class BatchSimulation:
+    """N games of pac man as arrays. layouts is a list of cells (like Game.cells)
+       or Level objects, one per game. If only one layout is given, it is used for all n games.
+       Smaller layouts are padded with walls, missing ghosts are inactive.
+
+       arrays (N = number of games, G = most ghosts in one layout):
+       walls, pills: (N, height, width) bool
+       exits: (N, height, width) 4-bit mask of open directions, like Maze.exits
+       player_x, player_y, lives, points: (N,)
+       ghost_x, ghost_y, ghost_direction, ghost_active: (N, G)
+       occupancy: (N, height, width) number of ghosts in each cell
+    """
+
+    def __init__(self, layouts=None, n=1, seed=None):
+        if layouts is None:
+            layouts = [Game.cells]
+        if len(layouts) == 1:
+            layouts = layouts * n
+        self.n = len(layouts)
+        self.height = max(len(cells) for cells in layouts)
+        self.width = max(len(line) for cells in layouts for line in cells)
+        self.rng = np.random.default_rng(seed)
+        # ---- cells, padded with walls ----
+        self.cells = np.ones((self.n, self.height, self.width), dtype=np.int8)
+        for i, cells in enumerate(layouts):
+            if isinstance(cells, Level):
+                self.cells[i, :cells.height, :cells.width] = np.asarray(cells.view)
+                continue
+            for y, line in enumerate(cells):
+                self.cells[i, y, :len(line)] = line
+        self.walls = self.cells == 1
+        self.exits = np.zeros(self.cells.shape, dtype=np.uint8)
+        padded = np.pad(self.walls, ((0, 0), (1, 1), (1, 1)), constant_values=True)
+        for d in range(4):
+            neighbour = padded[:, 1 + DY[d]:1 + DY[d] + self.height, 1 + DX[d]:1 + DX[d] + self.width]
+            self.exits |= np.where(neighbour | self.walls, 0, BITS[d]).astype(np.uint8)
+        ghost_cells = (self.cells >= 4) & (self.cells <= 7)
+        self.ghosts = int(ghost_cells.sum(axis=(1, 2)).max())
+        # ---- start positions ----
+        self.player_startx = np.zeros(self.n, dtype=np.int32)
+        self.player_starty = np.zeros(self.n, dtype=np.int32)
+        self.ghost_startx = np.zeros((self.n, self.ghosts), dtype=np.int32)
+        self.ghost_starty = np.zeros((self.n, self.ghosts), dtype=np.int32)
+        self.ghost_active = np.zeros((self.n, self.ghosts), dtype=bool)
+        for i in range(self.n):
+            ys, xs = np.nonzero(self.cells[i] == 2)
+            if len(xs) == 0:
+                raise ValueError(f"layout {i} has no player (2)")
+            self.player_startx[i], self.player_starty[i] = xs[0], ys[0]
+            # row by row, like GameState numbers the ghosts
+            ys, xs = np.nonzero(ghost_cells[i])
+            self.ghost_startx[i, :len(xs)] = xs
+            self.ghost_starty[i, :len(ys)] = ys
+            self.ghost_active[i, :len(xs)] = True
+        self.reset()
+
+    def reset(self):
+        """start new games in all layouts"""
+        self.pills = self.cells == 0
+        self.lives = np.full(self.n, Game.lives, dtype=np.int32)
+        self.points = np.zeros(self.n, dtype=np.int32)
+        self.tick = 0
+        self.player_x = self.player_startx.copy()
+        self.player_y = self.player_starty.copy()
+        self.player_direction = np.full(self.n, DIRECTIONS.index("east"), dtype=np.int32)
+        self.ghost_x = self.ghost_startx.copy()
+        self.ghost_y = self.ghost_starty.copy()
+        self.ghost_direction = self.rng.integers(0, 4, (self.n, self.ghosts)).astype(np.int32)
+        self.occupancy = np.zeros((self.n, self.height, self.width), dtype=np.int16)
+        self.place_ghosts(np.ones(self.n, dtype=bool))
+
+    def place_ghosts(self, where):
+        """rebuild the occupancy grid of the games in where (bool array)"""
+        self.occupancy[where] = 0
+        games, g = np.nonzero(where[:, None] & self.ghost_active)
+        np.add.at(self.occupancy, (games, self.ghost_y[games, g], self.ghost_x[games, g]), 1)
+
+    def open_directions(self, games, x, y):
+        """(n, 4) bool array: which directions are not blocked by a wall"""
+        return (self.exits[games, y, x][:, None] & BITS[None, :]) > 0
+
+    def step(self, actions=None):
+        """play one turn in every game. actions is an int array of length n:
+           -1 (player waits) or index into DIRECTIONS.
+           returns three bool arrays: pill eaten, life lost, game over"""
+        self.tick += 1
+        games = np.arange(self.n)
+        ate = np.zeros(self.n, dtype=bool)
+        if actions is not None:
+            ate = self.move_players(games, np.asarray(actions, dtype=np.int32))
+        lost = np.zeros(self.n, dtype=bool)
+        over = np.zeros(self.n, dtype=bool)
+        caught = self.check_player_ghost_collision(lost, over)
+        self.move_ghosts(games, ~caught)
+        self.check_player_ghost_collision(lost, over, ~caught)
+        return ate, lost, over
+
+    def move_players(self, games, actions):
+        moving = actions >= 0
+        direction = np.where(moving, actions, 0)
+        self.player_direction = np.where(moving, direction, self.player_direction)
+        moving &= (self.exits[games, self.player_y, self.player_x] & BITS[direction]) > 0
+        nx = self.player_x + DX[direction]
+        ny = self.player_y + DY[direction]
+        self.player_x = np.where(moving, nx, self.player_x)
+        self.player_y = np.where(moving, ny, self.player_y)
+        ate = moving & self.pills[games, self.player_y, self.player_x]
+        self.pills[games[ate], self.player_y[ate], self.player_x[ate]] = False
+        self.points += ate
+        return ate
+
+    def move_ghosts(self, games, moving):
+        """move ghost 0 in all games, then ghost 1, ... like Simulation.move_ghost"""
+        for g in range(self.ghosts):
+            active = moving & self.ghost_active[:, g]
+            x = self.ghost_x[:, g]
+            y = self.ghost_y[:, g]
+            # ---- options: (n, 4) bool ----
+            tx = x[:, None] + DX[None, :]
+            ty = y[:, None] + DY[None, :]
+            options = self.open_directions(games, x, y)
+            options &= self.occupancy[games[:, None],
+                                      np.clip(ty, 0, self.height - 1),
+                                      np.clip(tx, 0, self.width - 1)] == 0
+            count = options.sum(axis=1)
+            direction = self.ghost_direction[:, g]
+            # no crossing, just continue old direction
+            corridor = ((count == 2) &
+                        options[games, direction] &
+                        options[games, (direction + 2) % 4])
+            # one option: take it. corner or crossing: random choice
+            pick = (self.rng.random(self.n) * np.maximum(count, 1)).astype(np.int32)
+            chosen = np.argmax(np.cumsum(options, axis=1) > pick[:, None], axis=1)
+            new_direction = np.where(corridor, direction, chosen)
+            go = active & (count > 0)
+            direction = np.where(go, new_direction, direction)
+            self.ghost_direction[:, g] = direction
+            nx = np.where(go, x + DX[direction], x)
+            ny = np.where(go, y + DY[direction], y)
+            self.occupancy[games[go], y[go], x[go]] -= 1
+            self.occupancy[games[go], ny[go], nx[go]] += 1
+            self.ghost_x[:, g] = nx
+            self.ghost_y[:, g] = ny
+
+    def check_player_ghost_collision(self, lost, over, where=None):
+        """lose a life in every game where a ghost caught the player. returns bool array"""
+        caught = self.occupancy[np.arange(self.n), self.player_y, self.player_x] > 0
+        if where is not None:
+            caught &= where
+        if not caught.any():
+            return caught
+        lost |= caught
+        self.lives -= caught
+        # teleport monsters and player back at start position
+        self.player_x = np.where(caught, self.player_startx, self.player_x)
+        self.player_y = np.where(caught, self.player_starty, self.player_y)
+        self.ghost_x = np.where(caught[:, None], self.ghost_startx, self.ghost_x)
+        self.ghost_y = np.where(caught[:, None], self.ghost_starty, self.ghost_y)
+        self.place_ghosts(caught)
+        dead = caught & (self.lives == 0)
+        if dead.any():
+            over |= dead
+            self.lives[dead] = Game.lives
+            self.points[dead] = 0
+            self.pills[dead] = self.cells[dead] == 0
+        return caught
@@ -0,0 +1,315 @@
+"""
+benchmarks for pac man
+
+runs without a window (SDL dummy video driver) and prints the results.
+usage: python benchmark.py [--json results.json] [--baseline baseline.json] [--tolerance 0.2] [--quick]
+
+--json writes all results into a json file. Save one as baseline, then --baseline compares
+every result with it: results that are worse by more than tolerance (0.2 = 20%) are regressions,
+and the exit code is 1.
+
+part of http://ThePythonGamebook.com
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import pacman
+
+MAZE_SIZES = (41, 101)  # besides the built-in maze: square mazes with this many cells per row
+GHOST_COUNTS = (4, 32, 128)
+
+
+class BenchViewer(pacman.Viewer):
+    """a Viewer with images, background and sprites, but without mainloop"""
+
+    def run(self):
+        self.wait_for_space = False
+
+
+def init_display(width=1200, height=800):
+    """set up the class variables of Viewer that sprites need, without running the game"""
+    pygame.init()
+    screen = pygame.display.set_mode((width, height))
+    pacman.Viewer.level = pacman.Level.from_cells(pacman.Game.cells)
+    pacman.Viewer.scroll = False
+    pacman.Viewer.set_geometry(width, height)
+    pacman.Viewer.font = pygame.freetype.SysFont(pygame.freetype.get_default_font(), 64)
+    pacman.Viewer.allgroup = pygame.sprite.LayeredUpdates()
+    pacman.VectorSprite.groups = pacman.Viewer.allgroup
+    return screen
+
+
+def make_maze(size, ghosts=4, seed=1):
+    """square Level with size x size cells: a wall around and a wall on every second cell (many crossings).
+       The player is in the middle, the ghosts on random free cells"""
+    rows = [[1 if x in (0, size - 1) or y in (0, size - 1) or (x % 2 == 0 and y % 2 == 0) else 0
+             for x in range(size)] for y in range(size)]
+    rows[size // 2 + 1][size // 2 + 1] = 2
+    rng = random.Random(seed)
+    placed = 0
+    while placed < ghosts:
+        x, y = rng.randrange(1, size - 1), rng.randrange(1, size - 1)
+        if rows[y][x] == 0:
+            rows[y][x] = 4 + placed % 4
+            placed += 1
+    return pacman.Level.from_cells(rows)
+
+
+def mazes():
+    """name -> Level for every maze size and ghost count"""
+    result = {"classic/g4": pacman.Level.from_cells(pacman.Game.cells)}
+    for size in MAZE_SIZES:
+        for ghosts in GHOST_COUNTS:
+            result[f"{size}x{size}/g{ghosts}"] = make_maze(size, ghosts)
+    return result
+
+
+def best_rate(function, n, repeat=5, min_time=0.1):
+    """function(n) is run repeat times, returns the best n per second.
+       n is made larger until one run takes at least min_time seconds, short runs are too noisy"""
+    start = time.perf_counter()
+    function(n)
+    while time.perf_counter() - start < min_time:
+        n *= 2
+        start = time.perf_counter()
+        function(n)
+    best = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(n)
+        best = max(best, n / (time.perf_counter() - start))
+    return best
+
+
+def sprites_per_second(make, n):
+    """create and kill n sprites"""
+    start = time.perf_counter()
+    for i in range(n):
+        make(i).kill()
+    return n / (time.perf_counter() - start)
+
+
+def bench_ghost_turns(level, ghost_mode="wander", ticks=100):
+    """game ticks per second of Simulation.step with waiting player: all ghosts move (Simulation.move_ghosts)"""
+    sim = pacman.Simulation(level, seed=1, ghost_mode=ghost_mode)
+
+    def run(n):
+        for _ in range(n):
+            sim.step(None)
+
+    return best_rate(run, ticks)
+
+
+def bench_pills(viewer, ticks=300):
+    """turns per second with a moving player: step, pill collision, removing eaten pills and sparks"""
+    rng = random.Random(1)
+    directions = tuple(pacman.Simulation.nesw)
+
+    def run(n):
+        viewer.sim.reset()
+        for pill in viewer.pillgroup:
+            pill.kill()
+        viewer.create_pills()
+        viewer.sync_sprites()
+        rng.seed(1)
+        for _ in range(n):
+            events = viewer.sim.step(rng.choice(directions))
+            viewer.sync_sprites()
+            viewer.handle_events(events)
+        for sprite in viewer.allgroup.sprites():
+            if isinstance(sprite, pacman.Flytext):
+                sprite.kill()  # "you lost a life" texts would slow down the next benchmarks
+
+    return best_rate(run, ticks)
+
+
+def bench_render(viewer, frames=100):
+    """frames per second: update and draw all sprites and the background of the screen.
+       With dirty_rects, only the changed parts are drawn"""
+    screen = viewer.screen
+
+    def run(n):
+        for _ in range(n):
+            viewer.allgroup.update(1 / 60)
+            viewer.interpolate_sprites()
+            if viewer.dirty_rects:
+                viewer.allgroup.draw(screen, viewer.background)
+            else:
+                viewer.camera.follow(viewer.player1.rect.center)
+                viewer.chunks.draw(screen, viewer.camera.rect)
+                viewer.allgroup.draw(screen)
+
+    return best_rate(run, frames)
+
+
+def bench_construction(n=20000):
+    """sprites per second for the often created sprite classes, with and without pooling"""
+    picture = pygame.Surface((pacman.Viewer.cell_width, pacman.Viewer.cell_height))
+    makers = {
+        pacman.Pill: lambda i: pacman.Pill(x=i % 20, y=i % 11, picture=picture),
+        pacman.Spark: lambda i: pacman.Spark(pos=pygame.math.Vector2(600, 400),
+                                             move=pygame.math.Vector2(100, 0),
+                                             max_age=0.8, angle=i % 360,
+                                             acceleration=0.95, color=(200, 200, 200)),
+        pacman.Flytext: lambda i: pacman.Flytext(text="let's go!"),
+    }
+    results = {}
+    for cls, make in makers.items():
+        pool = cls.pool
+        cls.pool = None  # no pooling
+        unpooled = sprites_per_second(make, n)
+        cls.pool = pool
+        pooled = sprites_per_second(make, n)
+        results[cls.__name__] = {"unpooled": unpooled, "pooled": pooled}
+    return results
+
+
+def bench_flytext(screen, texts=20, frames=60):
+    """frames per second with zooming, rotating and fading Flytexts. cold: the animations
+       are rendered for the first time, warm: they are taken from the Text cache"""
+    group = pacman.Viewer.allgroup
+
+    def run(n):
+        for i in range(texts):
+            pacman.Flytext(text=f"flytext {i}", pos=pygame.math.Vector2(600, 400), max_age=1,
+                           alpha_start=255, alpha_end=0, width_start=10, width_end=400,
+                           height_start=5, height_end=100, rotate_start=0, rotate_end=90)
+        for _ in range(n):
+            group.update(1 / frames)
+            group.draw(screen)
+        for sprite in group.sprites():
+            sprite.kill()
+
+    pacman.Text.cache.clear()
+    start = time.perf_counter()  # not best_rate: its first, untimed run would fill the cache
+    run(frames)
+    cold = frames / (time.perf_counter() - start)
+    warm = best_rate(run, frames, repeat=10, min_time=0)
+    return {"cold": cold, "warm": warm}
+
+
+def seconds_per_call(function, repeat=5, min_time=0.1):
+    """best time of one call of function(). Fast functions are called many times in a row,
+       so that even microseconds are measured exactly (see best_rate)"""
+
+    def run(n):
+        for _ in range(n):
+            function()
+
+    return 1 / best_rate(run, 1, repeat, min_time)
+
+
+def bench_startup(repeat=5):
+    """seconds for Viewer.load_images: png files (cold), image cache file (warm)
+       or atlas of a recently used cell size (resize).
+       The image cache is written into a temporary directory, data/cache is not touched"""
+    viewer = pacman.Viewer.__new__(pacman.Viewer)  # no __init__, it would start the game
+    cache_dir = pacman.Viewer.cache_dir
+    pacman.Viewer.cache_dir = tempfile.mkdtemp()
+
+    def cold():
+        shutil.rmtree(pacman.Viewer.cache_dir)
+        pacman.Viewer.asset_sets.clear()
+        viewer.load_images()
+
+    def warm():
+        pacman.Viewer.asset_sets.clear()
+        viewer.load_images()
+
+    try:
+        return {"png": seconds_per_call(cold, repeat), "cache": seconds_per_call(warm, repeat),
+                "resize": seconds_per_call(viewer.load_images, repeat)}
+    finally:
+        shutil.rmtree(pacman.Viewer.cache_dir, ignore_errors=True)
+        pacman.Viewer.cache_dir = cache_dir
+
+
+def run_all(quick=False):
+    """all benchmarks. returns dict: name -> {"value", "unit", "higher_is_better"}"""
+    results = {}
+
+    def add(name, value, unit="per second", higher_is_better=True):
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:40} {value:14,.6f} {unit}" if value < 1 else f"{name:40} {value:14,.0f} {unit}")
+
+    all_mazes = mazes()
+    if quick:
+        all_mazes = {name: level for name, level in all_mazes.items() if name.startswith(("classic", "41x41"))}
+    print("---- ghost turns ----")
+    for name, level in all_mazes.items():
+        for mode in ("wander", "chase"):
+            add(f"ghost_turns/{name}/{mode}", bench_ghost_turns(level, mode), "ticks per second")
+    print("---- pills and rendering ----")
+    for name, level in all_mazes.items():
+        if not name.endswith("/g4"):
+            continue  # more ghosts are measured by ghost turns
+        for dirty in (False, True):
+            viewer = BenchViewer(width=1200, height=800, level=level, seed=1, dirty_rects=dirty)
+            mode = "dirty" if dirty else "full"
+            add(f"pills/{name}/{mode}", bench_pills(viewer), "turns per second")
+            add(f"render/{name}/{mode}", bench_render(viewer), "frames per second")
+    screen = init_display()
+    print("---- sprite construction ----")
+    for cls, result in bench_construction(5000 if quick else 20000).items():
+        add(f"construction/{cls}/unpooled", result["unpooled"], "sprites per second")
+        add(f"construction/{cls}/pooled", result["pooled"], "sprites per second")
+    print("---- Flytext animation ----")
+    for key, value in bench_flytext(screen).items():
+        add(f"flytext/{key}", value, "frames per second")
+    print("---- startup: load_images ----")
+    for key, value in bench_startup(2 if quick else 5).items():
+        add(f"startup/{key}", value, "seconds", higher_is_better=False)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """print the change of every result against the baseline. returns the names of the regressions"""
+    regressions = []
+    print(f"---- compared with baseline (tolerance {tolerance:.0%}) ----")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], result["value"]
+        # change > 0 is better, change < 0 is worse
+        change = (new - old) / old if result["higher_is_better"] else (old - new) / old
+        flag = ""
+        if change < -tolerance:
+            flag = "REGRESSION"
+            regressions.append(name)
+        print(f"{name:40} {change:+8.1%} {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmarks for pac man")
+    parser.add_argument("--json", metavar="FILE", help="write the results into a json file")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with results of an earlier --json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, default 0.2 (20%%)")
+    parser.add_argument("--quick", action="store_true", help="only the small mazes, fewer repeats")
+    args = parser.parse_args()
+    results = run_all(args.quick)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": platform.python_version(), "pygame": pygame.version.ver,
+                       "platform": platform.platform(), "results": results}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
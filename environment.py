@@ -0,0 +1,264 @@
+"""
+pac man as environment for reinforcement learning, without window
+
+PacmanEnv has the reset() / step(action) interface of gym environments:
+    env = PacmanEnv()
+    observation, info = env.reset(seed=1)
+    observation, reward, terminated, truncated, info = env.step(action)
+
+actions: 0 north, 1 east, 2 south, 3 west, 4 wait (see ACTIONS)
+observation: uint8 array (4, height, width), one plane each for walls, pills, player and ghosts
+(number of ghosts in the cell). The planes are made from the cells of the level and the grid
+positions of player and ghosts, the same positions the Viewer uses for the sprites.
+
+VectorEnv runs many PacmanEnv in worker processes. The observations, rewards and done flags
+are written into shared memory, only short commands go through the pipes. Each worker steps
+its own slice of the environments, so the throughput grows with the number of cores as long
+as every worker has enough environments (some dozens) to make the pipe messages cheap.
+
+part of http://ThePythonGamebook.com
+"""
+
+import multiprocessing
+import os
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pacman import Game, Level, Simulation
+
+ACTIONS = tuple(Simulation.nesw.keys()) + (None,)  # index -> action of Simulation.step
+PLANES = ("walls", "pills", "player", "ghosts")
+
+
+class PacmanEnv:
+    """one game of pac man with reset() and step(action), like a gym environment.
+       level: a Level, a list of rows like Game.cells, or None for Game.cells
+       An episode ends (terminated) when the game is over or all pills are eaten,
+       and is truncated after max_steps turns.
+    """
+
+    rewards = {"pill": 1.0, "life_lost": -10.0, "game_over": 0.0, "cleared": 10.0}
+
+    def __init__(self, level=None, ghost_mode="wander", max_steps=2000):
+        if level is None:
+            level = Game.cells
+        self.sim = Simulation(level, seed=0, ghost_mode=ghost_mode)
+        self.width = self.sim.level.width
+        self.height = self.sim.level.height
+        self.max_steps = max_steps
+        self.action_space = len(ACTIONS)
+        self.observation_shape = (len(PLANES), self.height, self.width)
+        self.walls = np.frombuffer(self.sim.level.grid.tobytes(), dtype=np.uint8).reshape(
+            self.height, self.width) == 1
+        self.seeds = random.Random()
+        self.steps = 0
+        self.points = 0  # points of the episode, the Simulation sets its points to 0 at game over
+
+    def reset(self, seed=None, out=None):
+        """start a new episode. seed starts a new sequence of game seeds, the game seed of the
+           episode is in info, so that it can be played again (see Replay).
+           returns observation, info"""
+        if seed is not None:
+            self.seeds = random.Random(seed)
+        self.sim.seed = self.seeds.getrandbits(32)
+        self.sim.reset()
+        self.steps = 0
+        self.points = 0
+        return self.observe(out), {"seed": self.sim.seed}
+
+    def step(self, action, out=None):
+        """play one turn. action: index into ACTIONS.
+           returns observation, reward, terminated, truncated, info"""
+        events = self.sim.step(ACTIONS[action])
+        self.steps += 1
+        state = self.sim.state
+        reward = sum(self.rewards[event[0]] for event in events)
+        self.points += sum(event[0] == "pill" for event in events)
+        terminated = any(event[0] == "game_over" for event in events)
+        if state.pills_left == 0:
+            reward += self.rewards["cleared"]
+            terminated = True
+        truncated = not terminated and self.steps >= self.max_steps
+        info = {"points": self.points, "lives": state.lives, "pills_left": state.pills_left}
+        return self.observe(out), reward, terminated, truncated, info
+
+    def observe(self, out=None):
+        """the planes of PLANES as uint8 array. out: array to fill instead of a new one"""
+        if out is None:
+            out = np.empty(self.observation_shape, dtype=np.uint8)
+        state = self.sim.state
+        out[0] = self.walls
+        out[1] = np.frombuffer(state.pills, dtype=np.uint8).reshape(self.height, self.width)
+        out[2:] = 0
+        out[2, state.player.y, state.player.x] = 1
+        for ghost in state.ghosts:
+            out[3, ghost.y, ghost.x] += 1
+        return out
+
+
+class SharedArrays:
+    """numpy arrays of a VectorEnv in one block of shared memory:
+       observations (n, 4, height, width), actions, rewards, terminated, truncated (n,)"""
+
+    def __init__(self, n, shape, name=None):
+        self.layout = [("observations", (n,) + tuple(shape), np.uint8),
+                       ("actions", (n,), np.int8),
+                       ("rewards", (n,), np.float32),
+                       ("terminated", (n,), np.bool_),
+                       ("truncated", (n,), np.bool_)]
+        size = sum(int(np.prod(s)) * np.dtype(t).itemsize for _, s, t in self.layout)
+        self.owner = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        offset = 0
+        for key, s, t in self.layout:
+            array = np.ndarray(s, dtype=t, buffer=self.memory.buf, offset=offset)
+            setattr(self, key, array)
+            offset += array.nbytes
+
+    def close(self):
+        for key, _, _ in self.layout:
+            setattr(self, key, None)  # no views may be left when the memory is closed
+        try:
+            self.memory.close()
+        except BufferError:
+            pass  # arrays returned by VectorEnv.step are still used, the memory is freed with them
+        if self.owner:
+            self.memory.unlink()
+
+
+def worker(connection, memory_name, n, shape, first, layout, ghost_mode, max_steps):
+    """process of VectorEnv: steps its slice of the environments, starting with index first.
+       commands: ("reset", seeds), ("step",), ("close",)"""
+    width, height, cells = layout
+    level = Level(width, height, cells)
+    arrays = SharedArrays(n, shape, memory_name)
+    try:
+        serve(connection, arrays, first, level, ghost_mode, max_steps)
+    finally:
+        arrays.close()
+        connection.close()
+
+
+def serve(connection, arrays, first, level, ghost_mode, max_steps):
+    """answer the commands of VectorEnv until ("close",)"""
+    envs = []
+    while True:
+        command = connection.recv()
+        if command[0] == "reset":
+            seeds = command[1]
+            if not envs:
+                envs = [PacmanEnv(level, ghost_mode, max_steps) for _ in seeds]
+            for i, (env, seed) in enumerate(zip(envs, seeds)):
+                env.reset(seed, out=arrays.observations[first + i])
+            connection.send(None)
+        elif command[0] == "step":
+            finished = []  # (index, points) of the episodes that ended
+            for i, env in enumerate(envs):
+                k = first + i
+                obs = arrays.observations[k]
+                _, reward, terminated, truncated, info = env.step(arrays.actions[k], out=obs)
+                arrays.rewards[k] = reward
+                arrays.terminated[k] = terminated
+                arrays.truncated[k] = truncated
+                if terminated or truncated:
+                    finished.append((k, info["points"]))
+                    env.reset(out=obs)  # the next episode starts at once
+            connection.send(finished)
+        else:
+            return
+
+
+class VectorEnv:
+    """n PacmanEnv, split into slices over workers processes (default: one per core).
+       step(actions) plays one turn in all environments. Finished episodes are reset at once,
+       then the observation is the first one of the new episode.
+       The returned arrays live in shared memory and are overwritten by the next step, copy them to keep them.
+    """
+
+    def __init__(self, n, level=None, ghost_mode="wander", max_steps=2000, workers=None):
+        if level is None:
+            level = Game.cells
+        if not isinstance(level, Level):
+            level = Level.from_cells(level)
+        self.n = n
+        self.workers = max(1, min(n, workers or os.cpu_count() or 1))
+        self.observation_shape = (len(PLANES), level.height, level.width)
+        self.action_space = len(ACTIONS)
+        self.arrays = SharedArrays(n, self.observation_shape)
+        layout = (level.width, level.height, level.grid.tobytes())
+        # contiguous slices, the first n % workers workers get one environment more
+        bounds = [n * w // self.workers for w in range(self.workers + 1)]
+        self.slices = list(zip(bounds, bounds[1:]))
+        self.connections = []
+        self.processes = []
+        for first, end in self.slices:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker, daemon=True,
+                                              args=(child, self.arrays.memory.name, n, self.observation_shape,
+                                                    first, layout, ghost_mode, max_steps))
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def reset(self, seed=None):
+        """start new episodes everywhere. Environment i gets seed + i. returns observations"""
+        base = random.SystemRandom().getrandbits(32) if seed is None else seed
+        for connection, (first, end) in zip(self.connections, self.slices):
+            connection.send(("reset", [base + i for i in range(first, end)]))
+        for connection in self.connections:
+            connection.recv()
+        return self.arrays.observations
+
+    def step(self, actions):
+        """actions: one index into ACTIONS for every environment.
+           returns observations, rewards, terminated, truncated, finished
+           finished is a list of (index, points) of the episodes that ended in this step"""
+        self.arrays.actions[:] = actions
+        for connection in self.connections:
+            connection.send(("step",))
+        finished = []
+        for connection in self.connections:
+            finished.extend(connection.recv())
+        a = self.arrays
+        return a.observations, a.rewards, a.terminated, a.truncated, finished
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("close",))
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+        self.arrays.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="steps per second of random agents")
+    parser.add_argument("--envs", type=int, default=64, help="number of environments")
+    parser.add_argument("--workers", type=int, help="worker processes, default: one per core")
+    parser.add_argument("--steps", type=int, default=500, help="steps of every environment")
+    args = parser.parse_args()
+    rng = np.random.default_rng(1)
+    with VectorEnv(args.envs, workers=args.workers) as envs:
+        envs.reset(seed=1)
+        episodes = 0
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            _, _, _, _, finished = envs.step(rng.integers(0, envs.action_space, args.envs))
+            episodes += len(finished)
+        seconds = time.perf_counter() - start
+    print(f"{args.envs * args.steps / seconds:,.0f} steps per second with {envs.workers} workers, "
+          f"{episodes} episodes finished")
@@ -14,17 +14,43 @@ import pygame.freetype  # not automatically loaded when importing pygame!
 import pygame.gfxdraw
 import random
 import os
-
-
-class VectorSprite(pygame.sprite.Sprite):
-    """base class for sprites. this class inherits from pygame sprite class
+import array
+import collections
+import hashlib
+import json
+import mmap
+import re
+import struct
+import sys
+import time
+import zlib
+try:
+    import numpy
+except ImportError:
+    numpy = None  # without numpy, sparks are Spark sprites instead of a ParticleSystem
+
+
+class VectorSprite(pygame.sprite.DirtySprite):
+    """base class for sprites. this class inherits from pygame dirty sprite class,
+       so that it can be drawn by a normal LayeredUpdates group or by a DirtyGroup
     """
 
     number = 0  # unique number for each sprite
     images = []
+    pool = None  # list of killed sprites for reuse, see __new__. Only classes with their own pool are pooled
+    max_pool = 1000
+    world = True  # position in world coordinates, shifted by the camera (see CameraGroup). False: screen coordinates
 
     # numbers = {} # { number, Sprite }
 
+    def __new__(cls, *args, **kwargs):
+        """reuse a killed sprite from the pool of the class instead of allocating a new one.
+           __init__ is called on the reused sprite as for a new one"""
+        pool = cls.__dict__.get("pool")
+        if pool:
+            return pool.pop()
+        return super().__new__(cls)
+
     def __init__(self,
                  pos=None,
                  move=None,
@@ -55,19 +81,35 @@ class VectorSprite(pygame.sprite.Sprite):
                  animation_index = 0,
                  **kwargs):
         #self._default_parameters(**kwargs)
-        _locals = locals().copy() # copy locals() so that it does not updates itself
-        for key in _locals:
-            if key != "self" and key != "kwargs":  # iterate over all named arguments, including default values
-                setattr(self, key, _locals[key])
+        self.underlings = set()  # all sprites with this sprite as boss, see boss.setter
+        # all named arguments, including default values
+        self.pos = pygame.math.Vector2(200,200) if pos is None else pos
+        self.move = pygame.math.Vector2(0,0) if move is None else move
+        self.acceleration = acceleration
+        self._layer = _layer
+        self.angle = angle
+        self.radius = radius
+        self.color = color
+        self.hitpoints = hitpoints
+        self.hitpointsfull = hitpointsfull
+        self.stop_on_edge = stop_on_edge
+        self.kill_on_edge = kill_on_edge
+        self.bounce_on_edge = bounce_on_edge
+        self.warp_on_edge = warp_on_edge
+        self.age = age
+        self.max_age = max_age
+        self.max_distance = max_distance
+        self.picture = picture
+        self.boss = boss
+        self.move_with_boss = move_with_boss
+        self.area = area
+        self.animations_per_second = animations_per_second
+        self.animation_index = animation_index
         for key, arg in kwargs.items(): # iterate over all **kwargs arguments
             setattr(self, key, arg)
-        if pos is None:
-            self.pos = pygame.math.Vector2(200,200)
-        if move is None:
-            self.move = pygame.math.Vector2(0,0)
         self.animation_time_passed = 0
         self._overwrite_parameters()
-        pygame.sprite.Sprite.__init__(
+        pygame.sprite.DirtySprite.__init__(
             self, self.groups
         )  # call parent class. NEVER FORGET !
         self.number = VectorSprite.number  # unique number for each sprite
@@ -85,25 +127,44 @@ class VectorSprite(pygame.sprite.Sprite):
         pass
 
 
+    @property
+    def boss(self):
+        return self._boss
+
+    @boss.setter
+    def boss(self, boss):
+        """register this sprite as underling of the new boss"""
+        old_boss = self.__dict__.get("_boss")
+        if old_boss is not None:
+            old_boss.underlings.discard(self)
+        self._boss = boss
+        if boss is not None:
+            boss.underlings.add(self)
+
     def kill(self):
         # check if this is a boss and kill all his underlings as well
-        tokill = [s for s in Viewer.allgroup if "boss" in s.__dict__ and s.boss == self]
-        for s in tokill:
+        for s in tuple(self.underlings):
             s.kill()
+        if self._boss is not None:
+            self._boss.underlings.discard(self)
+        pool = type(self).__dict__.get("pool")
+        if pool is not None and self.alive() and len(pool) < self.max_pool:
+            pool.append(self)
         # if self.number in self.numbers:
         #   del VectorSprite.numbers[self.number] # remove Sprite from numbers dict
         pygame.sprite.Sprite.kill(self)
 
     def create_image(self):
         if self.picture is not None:
-            self.image = self.picture.copy()
+            # all sprites with the same picture share one image, so that rotations are cached for all
+            self.image = Rotation.cache.get(("picture", self.picture), self.picture.convert_alpha)
         elif self.animations_per_second is not None:
             self.image = self.images[self.animation_index]
         else:
             self.image = pygame.Surface((self.width, self.height))
             self.image.fill(self.color)
-        self.image = self.image.convert_alpha()
-        self.image0 = self.image.copy()
+            self.image = self.image.convert_alpha()
+        self.image0 = self.image
         self.rect = self.image.get_rect()
         self.rect.center = (round(self.pos[0], 0), round(self.pos[1], 0))
         # self.width = self.rect.width
@@ -114,8 +175,7 @@ class VectorSprite(pygame.sprite.Sprite):
         self.angle += by_degree
         self.angle = self.angle % 360
         oldcenter = self.rect.center
-        self.image = pygame.transform.rotate(self.image0, -self.angle)
-        self.image.convert_alpha()
+        self.image = Rotation.rotate(self.image0, -self.angle)
         self.rect = self.image.get_rect()
         self.rect.center = oldcenter
 
@@ -129,8 +189,7 @@ class VectorSprite(pygame.sprite.Sprite):
         self.angle = degree
         self.angle = self.angle % 360
         oldcenter = self.rect.center
-        self.image = pygame.transform.rotate(self.image0, -self.angle)
-        self.image.convert_alpha()
+        self.image = Rotation.rotate(self.image0, -self.angle)
         self.rect = self.image.get_rect()
         self.rect.center = oldcenter
 
@@ -221,7 +280,453 @@ class VectorSprite(pygame.sprite.Sprite):
                 self.pos.y = self.area.top
 
 
+class Cache:
+    """keeps the max_size most recently used values, the least recently used are dropped"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.values = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, key, make):
+        """return cached value for key, or call make() to create and cache it"""
+        try:
+            value = self.values[key]
+        except KeyError:
+            value = make()
+            self.values[key] = value
+            if len(self.values) > self.max_size:
+                self.values.popitem(last=False)
+            return value
+        self.values.move_to_end(key)
+        return value
+
+    def peek(self, key):
+        """return the cached value for key or None, without making it the most recently used"""
+        return self.values.get(key)
+
+    def clear(self):
+        self.values.clear()
+
+
+class Rotation:
+    """shared cache of rotated images. Angles are rounded to multiples of step degrees,
+       so every base image is rotated only once per angle.
+       smooth: use pygame.transform.rotozoom (antialiased, slower) instead of rotate
+       The cache also holds shared base images of sprites (pictures, sparks).
+       Never change a surface from the cache, make a copy first.
+    """
+    step = 1
+    smooth = False
+    cache = Cache(1024)
+
+    @classmethod
+    def rotate(cls, image, angle, cache=True):
+        """image rotated counterclockwise by angle degree, like pygame.transform.rotate
+           cache=False for images that are used only once, they would push shared images out of the cache"""
+        angle = round(angle / cls.step) * cls.step % 360
+        if angle == 0:
+            return image
+        smooth = cls.smooth
+
+        def make():
+            if smooth:
+                return pygame.transform.rotozoom(image, angle, 1.0)
+            return pygame.transform.rotate(image, angle)
+
+        if not cache:
+            return make()
+        return cls.cache.get((image, angle, smooth), make)
+
+
+class Text:
+    """shared text service: caches font objects and rendered text surfaces.
+       Only the 256 most recently used surfaces are kept, see Cache.
+       Never change a surface from the cache, make a copy first.
+    """
+    cache = Cache(256)  # key -> (surface, rect)
+    fonts = {}  # (font_name, font_size, bold) -> pygame.font.Font
+
+    @classmethod
+    def get(cls, key, make):
+        """return cached value for key, or call make() to create and cache it"""
+        return cls.cache.get(key, make)
+
+    @classmethod
+    def render(cls, text, size, color, style=pygame.freetype.STYLE_DEFAULT, bgcolor=None, rotation=0, cache=True):
+        """(surface, rect) of text rendered with Viewer.font, like pygame.freetype.Font.render"""
+        color = tuple(color)
+        bgcolor = None if bgcolor is None else tuple(bgcolor)
+
+        def make():
+            return Viewer.font.render(text=text, fgcolor=color, bgcolor=bgcolor,
+                                      style=style, rotation=rotation, size=size)
+
+        if not cache:
+            return make()
+        return cls.get(("freetype", text, size, color, style, bgcolor, rotation), make)
+
+    @classmethod
+    def sysfont(cls, font_name, font_size, bold):
+        """pygame.font.SysFont, created only once"""
+        key = (font_name, font_size, bold)
+        if key not in cls.fonts:
+            cls.fonts[key] = pygame.font.SysFont(font_name, font_size, bold)
+        return cls.fonts[key]
+
+    @classmethod
+    def render_sysfont(cls, text, color, font_name, font_size, bold):
+        """surface of text rendered with pygame.font.SysFont, antialiased"""
+        color = tuple(color)
+        return cls.get(("sysfont", text, color, font_name, font_size, bold),
+                       lambda: cls.sysfont(font_name, font_size, bold).render(text, True, color))
+
+
+class HudText:
+    """one piece of text on the screen (score, fps...). It renders only when its text changes.
+       anchor is the rect attribute that is set to pos, like "topleft" or "bottomleft"
+       value is an optional function returning the text, it is called by refresh()
+    """
+
+    def __init__(self, pos, size, color=(215, 215, 215), anchor="topleft", value=None):
+        self.pos = pos
+        self.value = value
+        self.size = size
+        self.color = color
+        self.anchor = anchor
+        self.text = None
+        self.surface = None
+        self.rect = pygame.Rect(pos, (0, 0))
+        self.old_rect = self.rect
+
+    def set(self, text):
+        """change the text. Nothing is rendered if the text is the same as before"""
+        if text == self.text:
+            return
+        self.text = text
+        # the hud changes too often to keep its old texts in the Text cache
+        self.surface, rect = Text.render(text, self.size, self.color, cache=False)
+        self.rect = self.surface.get_rect(**{self.anchor: self.pos})
+
+    def move(self, pos):
+        """put the text at a new position, without rendering it again"""
+        self.pos = pos
+        if self.surface is not None:
+            self.rect = self.surface.get_rect(**{self.anchor: self.pos})
+
+    def refresh(self):
+        """ask the bound value for the text, render only if it changed"""
+        if self.value is not None:
+            self.set(self.value())
+
+    def draw(self, screen):
+        """blit the text. returns the rect on the screen"""
+        self.old_rect = self.rect
+        return screen.blit(self.surface, self.rect)
+
+
+class FrameProfiler:
+    """times the phases of every frame (events, logic, hud, update, draw, flip).
+       mark(phase) ends a phase: the time since the last mark is added to that phase, so a phase
+       may be marked more than once in a frame. The milliseconds of the last window frames are kept
+       for percentiles and for the overlay graph.
+       overlay: draw() shows a graph and p50/p95/p99 of every phase, budget is the frame time in milliseconds
+       trace: filename, every phase is written into it as event of a Chrome trace (json,
+       see chrome://tracing or Perfetto). The events of each frame are written at the end of the frame,
+       so the memory does not grow with the length of the game. Call close() at the end
+       Without --profile and --trace the Viewer has no profiler, the only cost is a check for None per phase.
+    """
+    colors = {"events": (90, 90, 255), "logic": (255, 90, 90), "update": (0, 200, 0), "hud": (255, 255, 0),
+              "draw": (0, 200, 200), "overlay": (128, 128, 128), "flip": (200, 0, 200)}
+    graph_height = 100
+    pixels_per_ms = 2
+    label_interval = 30  # frames between new percentile texts
+
+    def __init__(self, window=300, overlay=True, trace=None, budget=1000 / 60):
+        self.window = window
+        self.overlay = overlay
+        self.budget = budget
+        self.times = {}  # phase -> deque with the milliseconds of the last window frames
+        self.totals = collections.deque(maxlen=window)
+        self.frame = {}  # phase -> milliseconds in the running frame
+        self.last_frame = {}
+        self.frames = 0
+        self.trace = None  # events of the running frame
+        self.trace_file = None
+        if trace is not None:
+            self.trace = []
+            self.trace_file = open(trace, "w")
+            self.trace_file.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        self.start = self.last = time.perf_counter()
+        self.graph = None
+        self.labels = []
+        self.rects = []  # drawn by draw(), to repaint in dirty_rects mode
+
+    def start_frame(self):
+        self.frame = {}
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """end of phase: add the time since the last mark"""
+        now = time.perf_counter()
+        ms = (now - self.last) * 1000
+        self.frame[phase] = self.frame.get(phase, 0) + ms
+        if self.trace is not None:
+            self.trace.append({"name": phase, "ph": "X", "pid": 1, "tid": 1,
+                               "ts": (self.last - self.start) * 1000000, "dur": ms * 1000,
+                               "args": {"frame": self.frames}})
+        self.last = now
+
+    def end_frame(self):
+        for phase in self.frame:
+            if phase not in self.times:
+                self.times[phase] = collections.deque(maxlen=self.window)
+        for phase, times in self.times.items():
+            times.append(self.frame.get(phase, 0))
+        self.totals.append(sum(self.frame.values()))
+        self.last_frame = self.frame
+        if self.trace:
+            if self.frames:
+                self.trace_file.write(",\n")
+            self.trace_file.write(",\n".join(json.dumps(event) for event in self.trace))
+            self.trace.clear()
+        self.frames += 1
+
+    @staticmethod
+    def percentiles(values, ps=(50, 95, 99)):
+        """nearest rank percentiles of values"""
+        values = sorted(values)
+        if not values:
+            return tuple(0 for _ in ps)
+        return tuple(values[min(len(values) - 1, len(values) * p // 100)] for p in ps)
+
+    def report(self):
+        """one line per phase: p50, p95 and p99 in milliseconds"""
+        lines = []
+        for phase, times in list(self.times.items()) + [("frame", self.totals)]:
+            p50, p95, p99 = self.percentiles(times)
+            lines.append(f"{phase:8} p50 {p50:6.2f}  p95 {p95:6.2f}  p99 {p99:6.2f} ms")
+        return lines
+
+    def draw(self, surface):
+        """scroll the graph by one pixel, add the last frame and blit graph and percentiles
+           at the top right of surface. returns the rects on the screen"""
+        h = FrameProfiler.graph_height
+        if self.graph is None:
+            self.graph = pygame.Surface((self.window, h))
+        self.graph.scroll(-1, 0)
+        x = self.window - 1
+        self.graph.fill((0, 0, 0), (x, 0, 1, h))
+        y = h
+        for phase, ms in self.last_frame.items():
+            height = ms * FrameProfiler.pixels_per_ms
+            color = FrameProfiler.colors.get(phase, (255, 255, 255))
+            self.graph.fill(color, (x, round(y - height), 1, round(height) + 1))
+            y -= height
+        self.graph.set_at((x, max(0, h - round(self.budget * FrameProfiler.pixels_per_ms))), (255, 255, 255))
+        if self.frames % FrameProfiler.label_interval == 1 or not self.labels:
+            phases = list(self.times) + ["frame"]
+            self.labels = [Text.render(line, 12, FrameProfiler.colors.get(phase, (255, 255, 255)), cache=False)[0]
+                           for phase, line in zip(phases, self.report())]
+        rect = self.graph.get_rect(topright=(surface.get_width() - 10, 40))
+        self.rects = [surface.blit(self.graph, rect)]
+        for label in self.labels:
+            self.rects.append(surface.blit(label, (rect.left, self.rects[-1].bottom + 2)))
+        return self.rects
+
+    def close(self):
+        """finish the trace file"""
+        if self.trace_file is not None:
+            self.trace_file.write("\n]}\n")
+            self.trace_file.close()
+            self.trace_file = None
+
+
+class Atlas:
+    """all images of the game packed into one big surface (texture atlas).
+       frames[name] is a list of subsurfaces of the atlas: they share the pixels of the atlas.
+       rects[name] is the list of matching source rects, to draw many images at once with blits
+    """
+
+    def __init__(self, surface, rects):
+        self.surface = surface
+        self.rects = rects
+        self.frames = {name: [surface.subsurface(rect) for rect in name_rects]
+                       for name, name_rects in rects.items()}
+
+    @classmethod
+    def pack(cls, images):
+        """pack a dict of image lists (name -> list of surfaces) into rows of a new atlas"""
+        all_images = [image for name_images in images.values() for image in name_images]
+        area = sum(image.get_width() * image.get_height() for image in all_images)
+        max_width = max(int(area ** 0.5) + 1, max(image.get_width() for image in all_images))
+        rects = {}
+        x, y, row_height = 0, 0, 0
+        for name, name_images in images.items():
+            rects[name] = []
+            for image in name_images:
+                w, h = image.get_size()
+                if x + w > max_width:  # next row
+                    x, y, row_height = 0, y + row_height, 0
+                rects[name].append(pygame.Rect(x, y, w, h))
+                x += w
+                row_height = max(row_height, h)
+        surface = pygame.Surface((max_width, y + row_height), pygame.SRCALPHA)
+        for name, name_images in images.items():
+            for image, rect in zip(name_images, rects[name]):
+                surface.blit(image, rect)
+        return cls(surface.convert_alpha(), rects)
+
+    def blits(self, surface, stamps):
+        """draw many images with one call. stamps: iterable of (name, index, topleft position)"""
+        rects = self.rects
+        return surface.blits([(self.surface, pos, rects[name][index]) for name, index, pos in stamps])
+
+    def save(self, filename):
+        """write the atlas into one file: a json header line with the rects, then the raw RGBA pixels"""
+        header = {"version": 2, "size": self.surface.get_size(),
+                  "rects": {name: [tuple(rect) for rect in name_rects] for name, name_rects in self.rects.items()}}
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = filename + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(pygame.image.tobytes(self.surface, "RGBA"))
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """read a file written by save. The file is memory mapped and converted into the display format"""
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = data.find(b"\n") + 1
+                header = json.loads(data[:start])
+                if header["version"] != 2:
+                    raise ValueError(f"unknown image cache version in {filename}")
+                size = tuple(header["size"])
+                surface = pygame.image.frombytes(data[start:start + size[0] * size[1] * 4], size, "RGBA")
+        rects = {name: [pygame.Rect(rect) for rect in name_rects] for name, name_rects in header["rects"].items()}
+        return cls(surface.convert_alpha(), rects)
+
+
+class DirtyGroup(pygame.sprite.LayeredDirty):
+    """LayeredDirty group for VectorSprites. VectorSprites do not set their dirty flag themselves,
+       so before drawing, every sprite with a new image or a new rect since the last draw is marked dirty.
+       Only dirty sprites (and sprites overlapping them) are redrawn, draw returns the changed rects.
+       Use repaint_rect to redraw other parts of the screen (text, particles)"""
+
+    def draw(self, surface, bgsurf=None, special_flags=None):
+        drawn = self.spritedict
+        for sprite in self._spritelist:
+            if sprite.dirty == 0 and (sprite.image is not getattr(sprite, "drawn_image", None)
+                                      or sprite.rect != drawn[sprite]):
+                sprite.dirty = 1
+            sprite.drawn_image = sprite.image
+        # overlapping areas would be drawn twice, making transparent images brighter
+        self.lostsprites = merge_rects(self.lostsprites)
+        return pygame.sprite.LayeredDirty.draw(self, surface, bgsurf, special_flags)
+
+
+class Camera:
+    """the part of the world (in pixels) that is shown on the screen: rect.
+       follow() centers a position, but the camera never shows anything outside of world.
+       near is rect plus margin: sprites outside of near are not updated (see CameraGroup)"""
+
+    def __init__(self, width, height, world, margin=128):
+        self.rect = pygame.Rect(0, 0, width, height)
+        self.world = world
+        self.margin = margin
+        self.near = self.rect.inflate(2 * margin, 2 * margin)
+        self.moved = True
+
+    def follow(self, pos):
+        """center the camera on pos. moved is True if the camera moved"""
+        old = self.rect.topleft
+        self.rect.x = int(between(pos[0] - self.rect.width // 2, 0, max(0, self.world.width - self.rect.width)))
+        self.rect.y = int(between(pos[1] - self.rect.height // 2, 0, max(0, self.world.height - self.rect.height)))
+        self.near.center = self.rect.center
+        self.moved = self.rect.topleft != old
+        return self.moved
+
+    def set_size(self, width, height):
+        """new screen size"""
+        self.rect.size = (width, height)
+        self.near = self.rect.inflate(2 * self.margin, 2 * self.margin)
+        self.moved = True
+
+
+class CameraGroup(pygame.sprite.LayeredUpdates):
+    """LayeredUpdates group that draws world sprites shifted by the camera.
+       Only sprites near the camera are updated and only visible sprites are drawn.
+       Sprites with a max_age live only shortly and are always updated, so that they die in time"""
+
+    def __init__(self, camera, *sprites):
+        super().__init__(*sprites)
+        self.camera = camera
+
+    def update(self, seconds):
+        near = self.camera.near
+        for sprite in self.sprites():
+            if not sprite.world or sprite.max_age is not None or near.collidepoint(sprite.pos):
+                sprite.update(seconds)
+
+    def draw(self, surface):
+        view = self.camera.rect
+        dx, dy = -view.x, -view.y
+        return surface.blits([(sprite.image, sprite.rect.move(dx, dy)) if sprite.world else (sprite.image, sprite.rect)
+                              for sprite in self.sprites() if not sprite.world or view.colliderect(sprite.rect)])
+
+
+class ChunkedBackground:
+    """the background of the world in square chunks of about chunk_pixels. A chunk is painted by paint
+       (function: surface, left, top, right, bottom cell) when it comes into view for the first time.
+       Only the max_chunks most recently shown chunks are kept"""
+
+    chunk_pixels = 512
+
+    def __init__(self, paint, cell_width, cell_height, max_chunks=48):
+        self.paint = paint
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.chunk_cells = (max(1, self.chunk_pixels // cell_width), max(1, self.chunk_pixels // cell_height))
+        self.chunk_size = (self.chunk_cells[0] * cell_width, self.chunk_cells[1] * cell_height)
+        self.chunks = Cache(max_chunks)
+
+    def chunk(self, cx, cy):
+        return self.chunks.get((cx, cy), lambda: self.bake(cx, cy))
+
+    def bake(self, cx, cy):
+        surface = pygame.Surface(self.chunk_size).convert()
+        left, top = cx * self.chunk_cells[0], cy * self.chunk_cells[1]
+        self.paint(surface, left, top, left + self.chunk_cells[0], top + self.chunk_cells[1])
+        return surface
+
+    def draw(self, surface, view):
+        """blit the chunks inside the world rect view onto surface"""
+        w, h = self.chunk_size
+        surface.blits([(self.chunk(cx, cy), (cx * w - view.x, cy * h - view.y))
+                       for cy in range(view.top // h, (view.bottom - 1) // h + 1)
+                       for cx in range(view.left // w, (view.right - 1) // w + 1)])
+
+    def fill_cell(self, x, y, color):
+        """paint one cell, if its chunk is baked. Otherwise the chunk gets the new look when it is baked"""
+        chunk = self.chunks.peek((x // self.chunk_cells[0], y // self.chunk_cells[1]))
+        if chunk is not None:
+            chunk.fill(color, ((x % self.chunk_cells[0]) * self.cell_width, (y % self.chunk_cells[1]) * self.cell_height,
+                               self.cell_width, self.cell_height))
+
+    def clear(self):
+        """forget all chunks, they are painted again when they are shown"""
+        self.chunks.clear()
+
+
 class Flytext(VectorSprite):
+
+    pool = []
+    world = False  # texts stay where they are on the screen
+    baked_frames = 30  # how many images are rendered for an animated (zooming, rotating, fading) Flytext
+
     def __init__(
             self,
             pos=pygame.math.Vector2(50, 50),
@@ -320,76 +825,80 @@ class Flytext(VectorSprite):
         # acceleration_factor  # if < 1, Text moves slower. if > 1, text moves faster.
 
     def create_image(self):
+        if self.recalc_each_frame:
+            # animated: the frames are baked only once and shared by all Flytexts with the same parameters
+            frames = Text.get(self.animation_key(), self.bake_frames)
+            self.image = frames[int(round(between(self.age / self.max_age, 0, 1) * (len(frames) - 1)))]
+        else:
+            self.image = self.render_frame(self.age)
+        self.rect = self.image.get_rect()
+        self.rect.center = (int(round(self.pos.x, 0)), int(round(self.pos.y, 0)))
+
+    def animation_key(self):
+        """all parameters that change how the animation looks"""
+        return ("flytext", self.text, self.picture, self.fontsize, tuple(self.color),
+                None if self.bgcolor is None else tuple(self.bgcolor), self.style, self.textrotation,
+                self.alpha_start, self.alpha_end, self.width_start, self.width_end,
+                self.height_start, self.height_end, self.rotate_start, self.rotate_end, self.max_age)
+
+    def bake_frames(self):
+        """render baked_frames images, from age 0 to age max_age"""
+        n = Flytext.baked_frames
+        return [self.render_frame(self.max_age * i / (n - 1)) for i in range(n)]
+
+    def render_frame(self, age):
+        """the image of the Flytext at a given age"""
         if self.picture is not None:
             # print("picture", self)
-            self.image = self.picture
+            image = self.picture
         else:
             # print("no picture", self)
-            myfont = Viewer.font
-            # text, textrect = myfont.render(
-            # fgcolor=self.color,
-            # bgcolor=self.bgcolor,
-            # get_rect(text, style=STYLE_DEFAULT, rotation=0, size=0) -> rect
-            textrect = myfont.get_rect(
+            # the same text is rendered only once for all Flytexts, see Text
+            image, textrect = Text.render(
                 text=self.text,
                 size=self.fontsize,
-                rotation=self.textrotation,
-                style=self.style,
-            )  # font 22
-            self.image = pygame.Surface((textrect.width, textrect.height))
-            # render_to(surf, dest, text, fgcolor=None, bgcolor=None, style=STYLE_DEFAULT, rotation=0, size=0) -> Rect
-            textrect = myfont.render_to(
-                surf=self.image,
-                dest=(0, 0),
-                text=self.text,
-                fgcolor=self.color,
+                color=self.color,
                 bgcolor=self.bgcolor,
                 style=self.style,
                 rotation=self.textrotation,
-                size=self.fontsize,
             )
-            if self.bgcolor is None:
-                self.image.set_colorkey((0, 0, 0))
-
-            self.rect = textrect
             # picture ? overwrites text
+        shared = True  # image is the cached text or the picture, not a new surface
 
         # transparent ?
         if self.alpha_start == self.alpha_end == 255:
             pass
         elif self.alpha_start == self.alpha_end:
-            self.image.set_alpha(self.alpha_start)
+            image = image.copy()  # do not change the cached text
+            shared = False
+            image.set_alpha(self.alpha_start)
             # print("fix alpha", self.alpha_start)
         else:
-            self.image.set_alpha(
-                self.alpha_start - self.age * self.alpha_diff_per_second
+            image = image.copy()  # do not change the cached text
+            shared = False
+            image.set_alpha(
+                self.alpha_start - age * self.alpha_diff_per_second
             )
-            # print("alpha:", self.alpha_start - self.age * self.alpha_diff_per_second)
-        self.image.convert_alpha()
-        # save the rect center for zooming and rotating
-        oldcenter = self.image.get_rect().center
+            # print("alpha:", self.alpha_start - age * self.alpha_diff_per_second)
         # dynamic zooming ?
         if self.width_start is not None or self.height_start is not None:
-            if self.width_start is None:
-                self.width_start = textrect.width
-            if self.height_start is None:
-                self.height_start = textrect.height
-            w = self.width_start + self.age * self.width_diff_per_second
-            h = self.height_start + self.age * self.height_diff_per_second
-            self.image = pygame.transform.scale(self.image, (int(w), int(h)))
-        # rotation?
+            width_start = image.get_width() if self.width_start is None else self.width_start
+            height_start = image.get_height() if self.height_start is None else self.height_start
+            w = width_start + age * self.width_diff_per_second
+            h = height_start + age * self.height_diff_per_second
+            image = pygame.transform.scale(image, (int(w), int(h)))
+            shared = False
+        # rotation? new surfaces are not put into the Rotation cache, the baked frames are cached by Text
         if self.rotate_start != 0 or self.rotate_end != 0:
             if self.rotate_diff_per_second == 0:
-                self.image = pygame.transform.rotate(self.image, self.rotate_start)
+                image = Rotation.rotate(image, self.rotate_start, cache=shared)
             else:
-                self.image = pygame.transform.rotate(
-                    self.image,
-                    self.rotate_start + self.age * self.rotate_diff_per_second,
+                image = Rotation.rotate(
+                    image,
+                    self.rotate_start + age * self.rotate_diff_per_second,
+                    cache=shared,
                 )
-        # restore the old center after zooming and rotating
-        self.rect = self.image.get_rect()
-        self.rect.center = oldcenter
-        self.rect.center = (int(round(self.pos.x, 0)), int(round(self.pos.y, 0)))
+        return image
 
     def update(self, seconds):
         VectorSprite.update(self, seconds)
@@ -401,47 +910,63 @@ class Flytext(VectorSprite):
 
 
 class Hitpointbar(VectorSprite):
+    """green bar over the boss. The bar image is only changed when the hitpoints
+       of the boss change by at least percent_step percent"""
     height = 5
+    percent_step = 2
+    cache = Cache(512)  # (width, percent) -> bar image, shared by all bars
 
     def _overwrite_parameters(self):
         self.kill_with_boss = True
         self.move_with_boss = True
+        self.shown = None
+
+    def value(self):
+        """(width, percent) of the boss, percent rounded to percent_step"""
+        percent = between(self.boss.hitpoints / self.boss.hitpointsfull * 100, 0, 100)
+        return self.boss.width, int(round(percent / self.percent_step)) * self.percent_step
 
     def create_image(self):
-        self.image = pygame.Surface((self.boss.width, self.height))
-        # self.image.fill((0,255,0))
-        percent = self.boss.width * (self.boss.hitpoints / self.boss.hitpointsfull)
-        pygame.draw.rect(self.image, (0, 255, 0), (0, 0, int(round(percent, 0)), self.height))
-        pygame.draw.rect(self.image, (0, 64, 0), (0, 0, self.boss.width, self.height), 1)
-        self.image.set_colorkey((0, 0, 0,))
-        self.image.convert_alpha()
+        self.shown = self.value()
+        self.image = Hitpointbar.cache.get(self.shown, lambda: self.draw_bar(*self.shown))
         self.rect = self.image.get_rect()
 
-        # self.rect.center = self.pos.x, self.pos.y
+    def draw_bar(self, width, percent):
+        image = pygame.Surface((width, self.height))
+        pygame.draw.rect(image, (0, 255, 0), (0, 0, int(round(width * percent / 100)), self.height))
+        pygame.draw.rect(image, (0, 64, 0), (0, 0, width, self.height), 1)
+        image.set_colorkey((0, 0, 0,))
+        return image.convert()
 
     def update(self, seconds):
-        self.create_image()
-        # super().update(seconds)
+        if self.value() != self.shown:
+            self.create_image()
         self.rect.center = self.boss.rect.centerx, self.boss.rect.centery - self.boss.height
 
 
-
 class Spark(VectorSprite):
 
+    pool = []
+
     def _overwrite_parameters(self):
         self._layer = 9
         self.kill_on_edge = True
-        self.color = randomize_colors(self.color, 50)
+        # colors in steps of 16, so that sparks can share images and their rotations
+        self.color = tuple(c // 16 * 16 for c in randomize_colors(self.color, 50))
 
     def create_image(self):
-        self.image = pygame.Surface((10, 10))
-        pygame.draw.line(self.image, self.color,
+        self.image = Rotation.cache.get(("spark", self.color), self.draw_spark)
+        self.rect = self.image.get_rect()
+        self.image0 = self.image
+
+    def draw_spark(self):
+        image = pygame.Surface((10, 10))
+        pygame.draw.line(image, self.color,
                          (10, 5), (5, 5), 3)
-        pygame.draw.line(self.image, self.color,
+        pygame.draw.line(image, self.color,
                          (5, 5), (2, 5), 1)
-        self.image.set_colorkey((0, 0, 0))
-        self.rect = self.image.get_rect()
-        self.image0 = self.image.copy()
+        image.set_colorkey((0, 0, 0))
+        return image
 
 
 class Smoke(VectorSprite):
@@ -492,15 +1017,150 @@ class Smoke(VectorSprite):
         self.image.convert_alpha()
 
 
+class ParticleSystem:
+    """many small particles (sparks, smoke) stored in numpy arrays instead of one sprite each.
+       All particles are moved in one vectorized update and drawn with Surface.blits.
+       stamps[kind][frame] are cached images: kind is chosen at emit, frame by age / max_age.
+       Dead particles leave free slots in the arrays that are reused by emit.
+    """
+
+    def __init__(self, stamps, capacity=2048, acceleration=1.0, area=None, rng=None):
+        self.stamps = stamps
+        self.rng = numpy.random.default_rng() if rng is None else rng  # numpy Generator for emit_sparks
+        self.frames = len(stamps[0])
+        self.acceleration = acceleration  # move vector is multiplied with acceleration each update
+        self.area = area  # particles leaving the area are killed, like kill_on_edge
+        # offset from center to topleft for each stamp
+        self.offset_x = numpy.array([[-s.get_width() // 2 for s in frames] for frames in stamps], dtype=numpy.int32)
+        self.offset_y = numpy.array([[-s.get_height() // 2 for s in frames] for frames in stamps], dtype=numpy.int32)
+        self.pos = numpy.zeros((capacity, 2), dtype=numpy.float32)
+        self.move = numpy.zeros((capacity, 2), dtype=numpy.float32)
+        self.age = numpy.zeros(capacity, dtype=numpy.float32)
+        self.max_age = numpy.ones(capacity, dtype=numpy.float32)
+        self.kind = numpy.zeros(capacity, dtype=numpy.int32)
+        self.alive = numpy.zeros(capacity, dtype=bool)
+        self.rects = []  # where the particles were drawn last time
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def emit(self, pos, move, max_age, kind):
+        """create particles. move and kind are arrays (one entry per particle), pos and max_age
+           can be arrays or one value for all. If the arrays are full, the remaining particles are dropped"""
+        free = numpy.flatnonzero(~self.alive)[:len(move)]
+        n = len(free)
+        self.pos[free] = numpy.broadcast_to(numpy.asarray(pos, dtype=numpy.float32), (len(move), 2))[:n]
+        self.move[free] = numpy.asarray(move, dtype=numpy.float32)[:n]
+        self.age[free] = 0
+        self.max_age[free] = numpy.broadcast_to(numpy.asarray(max_age, dtype=numpy.float32), (len(move),))[:n]
+        self.kind[free] = numpy.asarray(kind)[:n]
+        self.alive[free] = True
+
+    def update(self, seconds):
+        live = numpy.flatnonzero(self.alive)
+        if len(live) == 0:
+            return
+        self.age[live] += seconds
+        self.move[live] *= self.acceleration
+        self.pos[live] += self.move[live] * seconds
+        dead = self.age[live] > self.max_age[live]
+        if self.area is not None:
+            x, y = self.pos[live, 0], self.pos[live, 1]
+            dead |= ((x < self.area.left) | (x > self.area.right) |
+                     (y < self.area.top) | (y > self.area.bottom))
+        self.alive[live[dead]] = False
+
+    def draw(self, surface, offset=(0, 0)):
+        """blit all particles, shifted by -offset (camera). returns the list of drawn rects"""
+        live = numpy.flatnonzero(self.alive)
+        if len(live) == 0:
+            self.rects = []
+            return self.rects
+        kind = self.kind[live]
+        frame = numpy.minimum((self.age[live] / self.max_age[live] * self.frames).astype(numpy.int32), self.frames - 1)
+        x = numpy.rint(self.pos[live, 0]).astype(numpy.int32) + self.offset_x[kind, frame] - offset[0]
+        y = numpy.rint(self.pos[live, 1]).astype(numpy.int32) + self.offset_y[kind, frame] - offset[1]
+        stamps = self.stamps
+        self.rects = surface.blits([(stamps[k][f], (px, py)) for k, f, px, py
+                                    in zip(kind.tolist(), frame.tolist(), x.tolist(), y.tolist())])
+        return self.rects
+
+    @classmethod
+    def sparks(cls, color=(200, 200, 200), colors=8, angle_step=10, **kwargs):
+        """particles looking like Spark sprites. kind = color_number * angles + angle // angle_step"""
+        stamps = []
+        rng = kwargs.get("rng")
+        palette = random if rng is None else random.Random(int(rng.integers(2 ** 32)))
+        for _ in range(colors):
+            c = randomize_colors(color, 50, palette)
+            image = pygame.Surface((10, 10))
+            pygame.draw.line(image, c, (10, 5), (5, 5), 3)
+            pygame.draw.line(image, c, (5, 5), (2, 5), 1)
+            image.set_colorkey((0, 0, 0))
+            for angle in range(0, 360, angle_step):
+                stamps.append([pygame.transform.rotate(image, -angle).convert()])
+        system = cls(stamps, **kwargs)
+        system.colors = colors
+        system.angle_step = angle_step
+        return system
+
+    def emit_sparks(self, pos, number=5, speed=(100, 150), max_age=0.8):
+        """number of sparks flying in random directions from pos"""
+        angles = self.rng.integers(0, 360, number)
+        speeds = self.rng.integers(speed[0], speed[1] + 1, number)
+        radians = numpy.radians(angles)
+        move = numpy.stack((numpy.cos(radians) * speeds, numpy.sin(radians) * speeds), axis=1)
+        angles_per_color = 360 // self.angle_step
+        kind = (self.rng.integers(0, self.colors, number) * angles_per_color
+                + (angles // self.angle_step) % angles_per_color)
+        self.emit(pos, move, max_age, kind)
+
+    @classmethod
+    def smoke(cls, color=(10, 10, 10), end_radius=10, alpha_start=64, **kwargs):
+        """particles looking like Smoke sprites: growing and fading circles, one kind"""
+        frames = []
+        for i in range(end_radius):
+            radius = i + 1
+            image = pygame.Surface((2 * radius, 2 * radius))
+            pygame.draw.circle(image, color, (radius, radius), radius)
+            image.set_colorkey((0, 0, 0))
+            image.set_alpha(int(alpha_start * (1 - i / end_radius)))
+            frames.append(image.convert())
+        return cls([frames], **kwargs)
+
+
 class Monster(VectorSprite):
 
+    last_pos = None  # position before the last turn, see interpolate
+
     def _overwrite_parameters(self):
         self._layer=7
         self.pos = pygame.math.Vector2(self.x * Viewer.cell_width + Viewer.cell_width//2, self.y * Viewer.cell_height+Viewer.cell_height//2)
         self._layer = 2
 
+    def set_cell(self, x, y):
+        """move the sprite into cell x,y of the labyrinth. A step to the next cell is shown
+           as a movement (see interpolate), everything else as teleport"""
+        step = abs(x - self.x) + abs(y - self.y)
+        old_pos = self.pos
+        self.x = x
+        self.y = y
+        self.pos = pygame.math.Vector2(x * Viewer.cell_width + Viewer.cell_width // 2,
+                                       y * Viewer.cell_height + Viewer.cell_height // 2)
+        self.last_pos = pygame.math.Vector2(old_pos if step == 1 else self.pos)
+        # far away sprites are not updated (see CameraGroup), but they must not be drawn at their old place
+        self.rect.center = (int(self.pos.x), int(self.pos.y))
+
+    def interpolate(self, alpha):
+        """put the sprite alpha (0...1) of the way from last_pos to pos"""
+        if self.last_pos is not None:
+            pos = self.last_pos.lerp(self.pos, alpha)
+            self.rect.center = (int(round(pos.x)), int(round(pos.y)))
+
 class Pill(VectorSprite):
 
+    pool = []
+
     def _overwrite_parameters(self):
         self.pos = pygame.math.Vector2(self.x * Viewer.cell_width + Viewer.cell_width // 2,
                                        self.y * Viewer.cell_height + Viewer.cell_height // 2)
@@ -519,66 +1179,21 @@ class Player(Monster):
         self.pos = pygame.math.Vector2(self.x * Viewer.cell_width + Viewer.cell_width//2, self.y * Viewer.cell_height+Viewer.cell_height//2)
         self._layer = 2
         self.animations_per_second = 5
-        self.xx = 0
-        self.yy = 0
 
 
 class Ghost(Monster):
-
-    nesw = {"north": (0,-1),
-            "east": (1,0),
-            "south": (0,1),
-            "west": (-1,0)
-            }
-    inverse = {"north":"south",
-               "east":"west",
-               "south":"north",
-               "west":"east"}
+    """only the picture of a ghost. the ghost itself (position, direction) is an Actor of the Simulation"""
 
     def _overwrite_parameters(self):
-        #self.nesw = [False, False, False, False] # direction to go: north, east, south, west
-        self.direction = random.choice(tuple(self.nesw.keys()))
         self.animations_per_second = 4
         self.pos = pygame.math.Vector2(self.x * Viewer.cell_width + Viewer.cell_width // 2,
                                        self.y * Viewer.cell_height + Viewer.cell_height // 2)
 
-    def move_nesw(self):
-        # get possible directions
-        self.options = []
-        for direction in self.nesw.keys():
-            dx, dy = self.nesw[direction][0], self.nesw[direction][1]
-            if Game.cells[self.y+dy][self.x+dx] != 1 : # not a wall
-                for other in [m for m in Viewer.ghostgroup if m.number != self.number]:
-                    if other.x == self.x +dx and other.y == self.y + dy:
-                        break
-                else: # no break at all
-                    self.options.append(direction)
-
-        # just one option
-        if len(self.options) == 0:
-            return
-        if len(self.options) ==1:
-            self.direction = self.options[0]
-        # no crossing, just continue old direction
-        elif self.options in ([self.direction, self.inverse[self.direction]],
-                            [self.inverse[self.direction], self.direction]):
-            pass  # keep old direction
-        # corner, T crossing, curve or full crossing
-        else:
-            self.direction = random.choice(self.options)
-        # ---- teleport -----
-        self.x += self.nesw[self.direction][0]
-        self.y += self.nesw[self.direction][1]
-        self.pos = pygame.math.Vector2(self.x * Viewer.cell_width + Viewer.cell_width // 2,
-                                       self.y * Viewer.cell_height + Viewer.cell_height // 2)
-
-
 
 class Game:
-    lives = 3
+    lives = 3  # lives at game start
     ghosts = 4
-    points = 0
-    # legend: 1: wall, 0: pill, 3: nothing, 2: player, 4,5,6,7: ghost
+    # legend: 1: wall, 0: pill, 3: nothing, 2: player, 4,5,6,7: ghost (see Level)
     cells = [
         [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
         [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1],
@@ -594,6 +1209,708 @@ class Game:
     ]
 
 
+class Level:
+    """the cells of a maze, see legend. grid is a flat buffer view (memoryview of bytes) with
+       one byte per cell, index y * width + x. view is the same buffer with shape (height, width): view[y, x].
+       level[y][x] also works (rows are memoryview slices), so a Level can be used like Game.cells.
+       A level needs exactly one player and only cell values of the legend, else ValueError is raised.
+
+       level files, see load and save:
+       text:   first line "pacman level 1", then one line of digits per row. Lines starting with # are comments
+       binary: magic b"PACLVL", then version (uint8), width and height (uint32, little endian), then the cells
+    """
+
+    legend = {0: "pill", 1: "wall", 2: "player", 3: "empty", 4: "ghost", 5: "ghost", 6: "ghost", 7: "ghost"}
+    version = 1
+    magic = b"PACLVL"
+    header = struct.Struct("<BII")  # version, width, height
+    text_header = "pacman level"
+    digits = bytes.maketrans(b"01234567", bytes(range(8)))  # text -> cell values
+    letters = bytes.maketrans(bytes(range(8)), b"01234567")  # cell values -> text
+    unknown = re.compile(b"[^\x00-\x07]")  # cell values that are not in the legend
+    player = re.compile(b"\x02")
+
+    def __init__(self, width, height, grid, mapped=None):
+        if width < 1 or height < 1 or len(grid) != width * height:
+            raise ValueError(f"level needs {width} x {height} cells, got {len(grid)}")
+        # checked on the buffer itself, a memory mapped grid is not copied
+        unknown = self.unknown.search(grid)
+        if unknown is not None:
+            raise ValueError(f"level has unknown cell value {unknown.group()[0]} at cell {unknown.start()}")
+        player = self.player.search(grid)
+        if player is None:
+            raise ValueError("level has no player (2)")
+        if self.player.search(grid, player.end()) is not None:
+            raise ValueError("level has more than one player (2)")
+        self.width = width
+        self.height = height
+        self.grid = memoryview(grid).cast("B")
+        self.view = self.grid.cast("B", (height, width))
+        self.mapped = mapped  # the mmap of a binary level file, it must stay open while grid is used
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        if not 0 <= y < self.height:
+            raise IndexError("level row out of range")
+        return self.grid[y * self.width:(y + 1) * self.width]
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield self[y]
+
+    @classmethod
+    def from_cells(cls, cells):
+        """make a level from a list of rows, like Game.cells"""
+        width = len(cells[0])
+        if any(len(line) != width for line in cells):
+            raise ValueError("all rows of a level must have the same length")
+        return cls(width, len(cells), bytes(value for line in cells for value in line))
+
+    @classmethod
+    def load(cls, filename):
+        """read a text or binary level file. Binary files are memory mapped, the Level does not copy the cells
+           (Maze and GameState make their own tables from them)"""
+        with open(filename, "rb") as f:
+            if f.read(len(cls.magic)) == cls.magic:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                grid = None
+                try:
+                    start = len(cls.magic) + cls.header.size
+                    if len(data) < start:
+                        raise ValueError(f"{filename} ends inside the level header")
+                    version, width, height = cls.header.unpack_from(data, len(cls.magic))
+                    if version != cls.version:
+                        raise ValueError(f"unknown level version {version} in {filename}")
+                    grid = memoryview(data)[start:start + width * height]
+                    return cls(width, height, grid, data)
+                except ValueError:
+                    if grid is not None:
+                        grid.release()
+                    data.close()
+                    raise
+            f.seek(0)
+            return cls.read_text(f, filename)
+
+    @classmethod
+    def read_text(cls, f, filename):
+        """read a text level line by line into one bytearray"""
+        first = f.readline().decode().split()
+        if first[:2] != cls.text_header.split() or len(first) != 3:
+            raise ValueError(f"{filename} is not a level file")
+        if int(first[2]) != cls.version:
+            raise ValueError(f"unknown level version {first[2]} in {filename}")
+        grid = bytearray()
+        width = None
+        height = 0
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(b"#"):
+                continue
+            if line.translate(None, b"01234567"):
+                raise ValueError(f"{filename} line {height + 1} of the maze: unknown cell in {line!r}")
+            if width is None:
+                width = len(line)
+            elif len(line) != width:
+                raise ValueError(f"{filename} line {height + 1} of the maze: {len(line)} cells instead of {width}")
+            grid += line.translate(cls.digits)
+            height += 1
+        return cls(width or 0, height, grid)
+
+    def save(self, filename):
+        """write a text level file if filename ends with .txt, otherwise a binary level file"""
+        tmp = filename + ".tmp"
+        with open(tmp, "wb") as f:
+            if filename.endswith(".txt"):
+                f.write(f"{self.text_header} {self.version}\n".encode())
+                for line in self:
+                    f.write(bytes(line).translate(self.letters) + b"\n")
+            else:
+                f.write(self.magic + self.header.pack(self.version, self.width, self.height))
+                f.write(self.grid)
+        os.replace(tmp, filename)
+
+
+class Maze:
+    """the labyrinth, compiled once from a Level when the level is loaded.
+       every cell has an index: y * width + x. All tables are flat arrays, no Python object per cell
+
+       walls:       bytearray, 1 for each wall cell
+       exits:       4-bit mask of open directions for each cell: 1 north, 2 east, 4 south, 8 west
+       junctions:   array of the cell indexes where a ghost has to decide: crossing, T crossing, corner or dead end
+       corridors:   corridor segments of straight cells between two junctions, three ints each:
+                    first cell, step (1 east-west, width north-south) and length. See segment
+       corridor_of: number of the corridor segment for each cell, -1 for walls and junctions
+    """
+
+    bits = {"north": 1, "east": 2, "south": 4, "west": 8}
+    straight = (1 | 4, 2 | 8)  # north-south corridor, east-west corridor
+    wall_table = bytes.maketrans(bytes(range(256)), b"\x00\x01" + bytes(254))  # cell value 1 -> 1, others -> 0
+    free_table = bytes.maketrans(b"\x00\x01", b"\x01\x00")  # wall 0 -> free 1, 1 -> 0
+    junction_table = bytes(0 if mask in (0, 1 | 4, 2 | 8) else 1 for mask in range(256))
+    straight_table = bytes({1 | 4: 1, 2 | 8: 2}.get(mask, 0) for mask in range(256))
+
+    def __init__(self, level):
+        self.width = width = level.width
+        self.height = level.height
+        size = width * self.height
+        self.walls = bytearray(level.grid.tobytes().translate(self.wall_table))
+        self.exits = self.make_exits()
+        self.junctions = array.array("i", GameState.find_all(self.exits.translate(self.junction_table), 1))
+        # ---- corridor segments: runs of straight cells along a row or a column ----
+        self.corridors = array.array("i")
+        self.corridor_of = array.array("i", [-1]) * size
+        straight = self.exits.translate(self.straight_table)
+        for match in re.finditer(b"\x02+", straight):  # east-west, a run can not pass the wall at the border
+            self.add_corridor(match.start(), 1, match.end() - match.start())
+        for x in range(width):
+            for match in re.finditer(b"\x01+", straight[x::width]):  # north-south
+                self.add_corridor(match.start() * width + x, width, match.end() - match.start())
+
+    def make_exits(self):
+        """exits of all cells at once: the cells are bytes of one big integer (0 wall, 1 free),
+           shifted by one cell for east and west and by one row for north and south"""
+        width, size = self.width, len(self.walls)
+        mask = (1 << 8 * size) - 1
+        free = int.from_bytes(self.walls.translate(self.free_table), "little")
+        not_first = int.from_bytes((b"\x00" + b"\x01" * (width - 1)) * self.height, "little")  # x > 0
+        not_last = int.from_bytes((b"\x01" * (width - 1) + b"\x00") * self.height, "little")  # x < width - 1
+        north = (free << 8 * width) & mask
+        east = (free >> 8) & not_last
+        south = free >> 8 * width
+        west = ((free << 8) & mask) & not_first
+        exits = (north | east << 1 | south << 2 | west << 3) & (free * 15)
+        return bytearray(exits.to_bytes(size, "little"))
+
+    def add_corridor(self, start, step, length):
+        number = len(self.corridors) // 3
+        self.corridors.extend((start, step, length))
+        self.corridor_of[start:start + step * length:step] = array.array("i", [number]) * length
+
+    def segment(self, number):
+        """cell indexes of corridor segment number"""
+        start, step, length = self.corridors[number * 3:number * 3 + 3]
+        return range(start, start + step * length, step)
+
+    def is_wall(self, x, y):
+        """outside the labyrinth is wall"""
+        if 0 <= y < self.height and 0 <= x < self.width:
+            return self.walls[y * self.width + x]
+        return True
+
+
+class DistanceField:
+    """distances (number of steps) from every cell of a maze to one target cell, shared by all ghosts
+       with the same target. The breadth-first search is lazy: it goes on ring by ring only until the
+       asked cells are reached, and it continues from there when a farther cell is asked.
+       When the target moves, the search starts again, but only as far as the ghosts are away."""
+
+    def __init__(self, maze, target=None):
+        self.maze = maze
+        self.target = None
+        if target is not None:
+            self.set_target(target)
+
+    def set_target(self, target):
+        """target is a cell index: y * width + x. Nothing happens if the target did not move"""
+        if target == self.target:
+            return
+        self.target = target
+        self.distance = array.array("i", [-1]) * len(self.maze.exits)
+        self.distance[target] = 0
+        self.frontier = [target]
+        self.radius = 0
+
+    def get(self, i):
+        """distance from cell index i to the target, -1 if the target can not be reached"""
+        distance = self.distance
+        while distance[i] < 0 and self.frontier:
+            self.expand()
+        return distance[i]
+
+    def expand(self):
+        """search one ring of cells farther"""
+        exits = self.maze.exits
+        width = self.maze.width
+        distance = self.distance
+        self.radius += 1
+        radius = self.radius
+        frontier = []
+        for i in self.frontier:
+            mask = exits[i]
+            for bit, j in ((1, i - width), (2, i + 1), (4, i + width), (8, i - 1)):
+                if mask & bit and distance[j] < 0:
+                    distance[j] = radius
+                    frontier.append(j)
+        self.frontier = frontier
+
+
+class PathTable:
+    """shortest ways between all pairs of walkable cells of a maze, computed once per maze.
+       Walkable cells are numbered: cells[n] is the cell index (y * width + x) of number n, number[cell index] is n or -1.
+       distances[a * size + b]: number of steps from walkable cell a to b (uint16), unreachable if 0xFFFF
+       hops: 2 bits for each pair a, b: the first step from a to b, index into directions (north, east, south, west)
+       Tables are saved in cache_dir, with the hash of the maze in the filename, and loaded memory mapped.
+    """
+
+    version = 1
+    unreachable = 0xFFFF
+    directions = ("north", "east", "south", "west")
+    max_cells = 8192  # walkable cells. the table needs 2.25 bytes * max_cells ** 2
+    cache_dir = os.path.join("data", "cache")
+
+    def __init__(self, width, cells, distances, hops, mapped=None):
+        self.width = width
+        self.cells = cells
+        self.size = len(cells)
+        self.distances = distances
+        self.hops = hops
+        self.mapped = mapped  # the mmap of a table file, it must stay open while the tables are used
+        self.number = {cell: n for n, cell in enumerate(cells)}
+
+    @staticmethod
+    def maze_hash(maze):
+        """hash of the size and the exits of all cells: mazes with the same hash have the same ways"""
+        return hashlib.sha1(struct.pack("<II", maze.width, maze.height) + bytes(maze.exits)).hexdigest()[:16]
+
+    @classmethod
+    def for_maze(cls, maze):
+        """load the table of maze from the cache, or build and save it"""
+        filename = os.path.join(cls.cache_dir, f"paths_{cls.maze_hash(maze)}.bin")
+        try:
+            return cls.load(filename)
+        except (OSError, ValueError, KeyError):
+            table = cls.build(maze)
+            try:
+                table.save(filename)
+            except OSError:
+                pass  # no cache, build the table again next time
+            return table
+
+    @classmethod
+    def build(cls, maze):
+        """one breadth-first search from every walkable cell. The first step of the way to a cell
+           is handed down from the cell where it was found"""
+        cells = [i for i, mask in enumerate(maze.exits) if mask]
+        size = len(cells)
+        if size > cls.max_cells:
+            raise ValueError(f"maze has {size} walkable cells, the path table is limited to {cls.max_cells}")
+        number = array.array("i", [-1]) * len(maze.exits)
+        for n, cell in enumerate(cells):
+            number[cell] = n
+        width = maze.width
+        steps = ((1, -width, 0), (2, 1, 1), (4, width, 2), (8, -1, 3))  # bit, index offset, direction number
+        distances = array.array("H", [cls.unreachable]) * (size * size)
+        hops = bytearray((size * size + 3) // 4)
+        for a, start in enumerate(cells):
+            row = a * size
+            distances[row + a] = 0
+            first = {}  # cell index -> direction number of the first step from start
+            mask = maze.exits[start]
+            frontier = []
+            for bit, offset, direction in steps:
+                if mask & bit:
+                    first[start + offset] = direction
+                    frontier.append(start + offset)
+            distance = 1
+            while frontier:
+                next_frontier = []
+                for i in frontier:
+                    k = row + number[i]
+                    distances[k] = distance
+                    direction = first[i]
+                    hops[k >> 2] |= direction << (2 * (k & 3))
+                    mask = maze.exits[i]
+                    for bit, offset, _ in steps:
+                        j = i + offset
+                        if mask & bit and j != start and j not in first:
+                            first[j] = direction
+                            next_frontier.append(j)
+                frontier = next_frontier
+                distance += 1
+        return cls(width, cells, memoryview(distances), memoryview(hops))
+
+    def distance(self, a, b):
+        """steps from cell index a to cell index b, -1 for walls and unreachable cells"""
+        na, nb = self.number.get(a), self.number.get(b)
+        if na is None or nb is None:
+            return -1
+        distance = self.distances[na * self.size + nb]
+        return -1 if distance == self.unreachable else distance
+
+    def next_step(self, a, b):
+        """first direction on a shortest way from cell index a to cell index b, None if there is no way"""
+        if self.distance(a, b) <= 0:
+            return None
+        k = self.number[a] * self.size + self.number[b]
+        return self.directions[(self.hops[k >> 2] >> (2 * (k & 3))) & 3]
+
+    def save(self, filename):
+        """a json header line, padded to 8 bytes, then the numbers of the walkable cells (uint32),
+           the distances (uint16) and the hops, in the byte order of this computer"""
+        header = json.dumps({"version": self.version, "byteorder": sys.byteorder,
+                             "width": self.width, "size": self.size}).encode()
+        header += b" " * (-(len(header) + 1) % 8) + b"\n"
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = filename + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(array.array("I", self.cells).tobytes())
+            f.write(self.distances)
+            f.write(self.hops)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """read a file written by save. The file is memory mapped, the tables are views into it"""
+        with open(filename, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = data.find(b"\n") + 1
+        header = json.loads(data[:start])
+        if header["version"] != cls.version or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"path table {filename} has another version or byte order")
+        size = header["size"]
+        view = memoryview(data)
+        cells_end = start + 4 * size
+        distances_end = cells_end + 2 * size * size
+        hops_end = distances_end + (size * size + 3) // 4
+        if len(data) != hops_end:
+            raise ValueError(f"path table {filename} is damaged")
+        return cls(header["width"], view[start:cells_end].cast("I").tolist(),
+                   view[cells_end:distances_end].cast("H"), view[distances_end:hops_end], data)
+
+
+class Actor:
+    """player or ghost inside the Simulation: only cell position and heading, no pygame"""
+
+    def __init__(self, x, y, direction="north", kind=2, number=0):
+        self.x = x
+        self.y = y
+        self.startx = x
+        self.starty = y
+        self.direction = direction
+        self.kind = kind      # cell value, see Level.legend: 2 player, 4,5,6,7 ghost
+        self.number = number
+
+    def reset(self):
+        """teleport back to start position"""
+        self.x = self.startx
+        self.y = self.starty
+
+
+class GameState:
+    """everything that changes while playing one game. Each Simulation has its own GameState,
+       so that several games can run in the same process"""
+
+    pill_table = bytes.maketrans(bytes(range(256)), b"\x01" + bytes(255))  # cell value 0 -> 1, others -> 0
+
+    def __init__(self, level):
+        self.level = level
+        self.width = level.width
+        self.height = level.height
+        self.lives = Game.lives
+        self.points = 0
+        self.tick = 0
+        # pill store: 1 for each cell with a pill not yet eaten, index y * width + x
+        cells = level.grid.tobytes()
+        self.pills_start = cells.translate(self.pill_table)
+        self.restore_pills()
+        self.player = None
+        self.ghosts = []
+        # occupancy: list of ghosts for each occupied cell, occupants[y * width + x]. Empty cells have no entry
+        self.occupants = {}
+        player = cells.find(2)
+        if player >= 0:
+            self.player = Actor(player % self.width, player // self.width, "east", 2)
+        # ghosts are numbered row by row
+        ghosts = sorted(i for kind in (4, 5, 6, 7) for i in self.find_all(cells, kind))
+        for i in ghosts:
+            x, y = i % self.width, i // self.width
+            ghost = Actor(x, y, kind=cells[i], number=len(self.ghosts))
+            self.ghosts.append(ghost)
+            self.occupants.setdefault(i, []).append(ghost)
+
+    @staticmethod
+    def find_all(cells, value):
+        """all indexes of value in the bytes cells"""
+        i = cells.find(value)
+        while i >= 0:
+            yield i
+            i = cells.find(value, i + 1)
+
+    def move_ghost_to(self, ghost, x, y):
+        """teleport a ghost into cell x,y and keep the occupancy up to date"""
+        old = ghost.y * self.width + ghost.x
+        occupants = self.occupants[old]
+        occupants.remove(ghost)
+        if not occupants:
+            del self.occupants[old]
+        ghost.x = x
+        ghost.y = y
+        self.occupants.setdefault(y * self.width + x, []).append(ghost)
+
+    def restore_pills(self):
+        """put a pill on every cell that had one at game start"""
+        self.pills = bytearray(self.pills_start)
+        self.pills_left = self.pills.count(1)
+
+    def eat_pill(self, x, y):
+        """remove the pill in cell x,y. returns True if there was a pill"""
+        i = y * self.width + x
+        if not self.pills[i]:
+            return False
+        self.pills[i] = 0
+        self.pills_left -= 1
+        return True
+
+    def checksum(self):
+        """crc32 of everything that changes while playing, to compare two runs of the same game"""
+        directions = tuple(Simulation.nesw.keys())
+        numbers = [self.tick, self.lives, self.points]
+        for actor in [self.player] + self.ghosts:
+            numbers += [actor.x, actor.y, directions.index(actor.direction)]
+        return zlib.crc32(self.pills, zlib.crc32(array.array("i", numbers).tobytes()))
+
+
+class Simulation:
+    """the game rules of pac man, without display. Call step() once per game turn.
+       step returns a list of events (tuples) for the Viewer to render:
+       ("pill", x, y), ("life_lost", x, y), ("game_over",)
+    """
+
+    nesw = {"north": (0,-1),
+            "east": (1,0),
+            "south": (0,1),
+            "west": (-1,0)
+            }
+    inverse = {"north":"south",
+               "east":"west",
+               "south":"north",
+               "west":"east"}
+    ghost_modes = ("wander", "chase", "scatter")
+
+    def __init__(self, cells=None, seed=None, ghost_mode="wander"):
+        """cells: a Level, or a list of rows like Game.cells (default)
+           ghost_mode: how ghosts choose their way at a junction, see ghost_modes
+           wander: random. chase: shortest way to the player. scatter: shortest way to the home corner of the ghost
+        """
+        if cells is None:
+            cells = Game.cells
+        if ghost_mode not in self.ghost_modes:
+            raise ValueError(f"unknown ghost mode {ghost_mode!r}, use one of {self.ghost_modes}")
+        self.level = cells if isinstance(cells, Level) else Level.from_cells(cells)
+        self.maze = Maze(self.level)
+        # without seed, a random seed is chosen, so that every game can be replayed (see Replay)
+        # the seed is reduced to 64 bit, the size of the seed in a replay file
+        self.seed = random.SystemRandom().getrandbits(32) if seed is None else seed % 2 ** 64
+        self.ghost_mode = ghost_mode
+        self.chase_field = DistanceField(self.maze)  # target: the player, shared by all chasing ghosts
+        self.corner_fields = None  # one DistanceField for each corner, made at the first scatter
+        self.paths = None  # PathTable, see path_table
+        self.reset()
+
+    def reset(self):
+        """start a new game with fresh state. The same seed gives the same game for the same actions"""
+        self.random = rng_stream(self.seed, "ghosts")
+        self.state = GameState(self.level)
+        for ghost in self.state.ghosts:
+            ghost.direction = self.random.choice(tuple(self.nesw.keys()))
+        return self.state
+
+    def step(self, action=None):
+        """play one game turn. action is None (player waits) or one of "north", "east", "south", "west" """
+        events = []
+        self.state.tick += 1
+        if action is not None:
+            self.move_player(action, events)
+        self.move_ghosts(events)
+        return events
+
+    def move_player(self, direction, events):
+        player = self.state.player
+        dx, dy = self.nesw[direction]
+        player.direction = direction
+        if not self.maze.exits[player.y * self.maze.width + player.x] & Maze.bits[direction]:
+            return
+        player.x += dx
+        player.y += dy
+        if self.state.eat_pill(player.x, player.y):
+            self.state.points += 1
+            events.append(("pill", player.x, player.y))
+
+    def move_ghosts(self, events):
+        if self.check_player_ghost_collision(events):
+            return
+        field = None
+        if self.ghost_mode == "chase":
+            player = self.state.player
+            field = self.chase_field
+            field.set_target(player.y * self.maze.width + player.x)
+        elif self.ghost_mode == "scatter" and self.corner_fields is None:
+            self.corner_fields = [DistanceField(self.maze, i) for i in self.corners()]
+        for ghost in self.state.ghosts:
+            if self.ghost_mode == "scatter":
+                field = self.corner_fields[ghost.number % 4]
+            self.move_ghost(ghost, field)
+        self.check_player_ghost_collision(events)
+
+    def path_table(self):
+        """shortest ways between all cells of the maze (see PathTable), loaded or built at the first call"""
+        if self.paths is None:
+            self.paths = PathTable.for_maze(self.maze)
+        return self.paths
+
+    def corners(self):
+        """cell indexes of the free cells nearest to the corners: topleft, topright, bottomleft, bottomright"""
+        maze = self.maze
+        free = [i for i, mask in enumerate(maze.exits) if mask]
+        corners = []
+        for cx, cy in ((0, 0), (maze.width - 1, 0), (0, maze.height - 1), (maze.width - 1, maze.height - 1)):
+            corners.append(min(free, key=lambda i: abs(i % maze.width - cx) + abs(i // maze.width - cy)))
+        return corners
+
+    def move_ghost(self, ghost, field=None):
+        """move a ghost one cell. At a junction, field (a DistanceField) chooses the shortest way,
+           without field the ghost chooses randomly"""
+        occupants = self.state.occupants
+        width = self.maze.width
+        here = ghost.y * width + ghost.x
+        exits = self.maze.exits[here]
+        dx, dy = self.nesw[ghost.direction]
+        # inside a straight corridor: run ahead without deciding
+        if exits in Maze.straight and exits & Maze.bits[ghost.direction] and here + dy * width + dx not in occupants:
+            self.state.move_ghost_to(ghost, ghost.x + dx, ghost.y + dy)
+            return
+        # get possible directions: no wall and no other ghost
+        options = []
+        for direction, (dx, dy) in self.nesw.items():
+            if exits & Maze.bits[direction] and here + dy * width + dx not in occupants:
+                options.append(direction)
+        # no option
+        if len(options) == 0:
+            return
+        # just one option
+        if len(options) == 1:
+            ghost.direction = options[0]
+        # no crossing, just continue old direction
+        elif options in ([ghost.direction, self.inverse[ghost.direction]],
+                         [self.inverse[ghost.direction], ghost.direction]):
+            pass  # keep old direction
+        # corner, T crossing, curve or full crossing: follow the distance field
+        elif field is not None:
+            ghost.direction = min(options, key=lambda d: self.field_distance(field, here, d))
+        # corner, T crossing, curve or full crossing: random
+        else:
+            ghost.direction = self.random.choice(options)
+        dx, dy = self.nesw[ghost.direction]
+        self.state.move_ghost_to(ghost, ghost.x + dx, ghost.y + dy)
+
+    def field_distance(self, field, here, direction):
+        """distance to the target of field after one step in direction. unreachable is farthest"""
+        dx, dy = self.nesw[direction]
+        distance = field.get(here + dy * self.maze.width + dx)
+        return distance if distance >= 0 else len(self.maze.exits)
+
+    def check_player_ghost_collision(self, events):
+        """returns True if a ghost caught the player. Only substract one life at max."""
+        player = self.state.player
+        if player.y * self.state.width + player.x not in self.state.occupants:
+            return False
+        self.state.lives -= 1
+        events.append(("life_lost", player.x, player.y))
+        self.reset_monsters_and_player()
+        if self.state.lives == 0:
+            events.append(("game_over",))
+            self.state.lives = Game.lives
+            self.state.points = 0
+            self.state.restore_pills()
+        return True
+
+    def reset_monsters_and_player(self):
+        """teleport monsters and player back at start position"""
+        self.state.player.reset()
+        for ghost in self.state.ghosts:
+            self.state.move_ghost_to(ghost, ghost.startx, ghost.starty)
+
+
+class Replay:
+    """input log of one game, to play it again exactly (for bug reports).
+       It keeps the seed, the hash of the maze, the ghost mode and the action of every tick (one byte).
+       After every interval ticks, a checksum of the GameState is added, play compares it.
+
+       file: magic b"PACREPLAY", header (version, seed, maze hash, ghost mode, interval), then for every
+       interval ticks: interval action bytes and the checksum (uint32), at the end the actions of the last ticks
+    """
+
+    magic = b"PACREPLAY"
+    version = 1
+    header = struct.Struct("<BQ16sBI")
+    actions = (None, "north", "east", "south", "west")
+
+    def __init__(self, seed, maze_hash, ghost_mode="wander", interval=60, log=b""):
+        self.seed = seed
+        self.maze_hash = maze_hash
+        self.ghost_mode = ghost_mode
+        self.interval = interval
+        self.log = bytearray(log)
+        self.ticks = len(self.log) - len(self.log) // (interval + 4) * 4
+
+    @classmethod
+    def record(cls, sim, interval=60):
+        """a new, empty replay for the game of sim, that just started (sim.reset)"""
+        return cls(sim.seed, PathTable.maze_hash(sim.maze), sim.ghost_mode, interval)
+
+    def add(self, action, state):
+        """log the action of one tick, after Simulation.step"""
+        self.log.append(self.actions.index(action))
+        self.ticks += 1
+        if self.ticks % self.interval == 0:
+            self.log += struct.pack("<I", state.checksum())
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.magic)
+            f.write(self.header.pack(self.version, self.seed, self.maze_hash.encode(),
+                                     Simulation.ghost_modes.index(self.ghost_mode), self.interval))
+            f.write(self.log)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            data = f.read()
+        if not data.startswith(cls.magic):
+            raise ValueError(f"{filename} is not a replay file")
+        version, seed, maze_hash, ghost_mode, interval = cls.header.unpack_from(data, len(cls.magic))
+        if version != cls.version:
+            raise ValueError(f"unknown replay version {version} in {filename}")
+        log = data[len(cls.magic) + cls.header.size:]
+        if interval <= len(log) % (interval + 4):
+            raise ValueError(f"{filename} ends inside a checksum")
+        return cls(seed, maze_hash.decode(), Simulation.ghost_modes[ghost_mode], interval, log)
+
+    def simulation(self, cells=None):
+        """a new Simulation for the replay. cells (a Level or list of rows) must be the maze of the recorded game"""
+        sim = Simulation(cells, seed=self.seed, ghost_mode=self.ghost_mode)
+        if PathTable.maze_hash(sim.maze) != self.maze_hash:
+            raise ValueError("the replay was recorded in another maze")
+        return sim
+
+    def play(self, sim):
+        """run all ticks of the replay in sim, as fast as possible. Raises ValueError if a checksum differs.
+           returns the number of ticks"""
+        actions = self.actions
+        step = self.interval + 4
+        for start in range(0, len(self.log), step):
+            for code in self.log[start:start + self.interval]:
+                sim.step(actions[code])
+            if start + step <= len(self.log):
+                checksum, = struct.unpack_from("<I", self.log, start + self.interval)
+                if sim.state.checksum() != checksum:
+                    raise ValueError(f"replay differs from the recorded game at tick {sim.state.tick}")
+        return self.ticks
+
+
 class Viewer:
     width = 0
     height = 0
@@ -601,8 +1918,24 @@ class Viewer:
     font = None
     cell_width = 0
     cell_height = 0
-    max_idle = 0.22 # how many seconds idletime is allowed before computer makes automatic turn
+    max_idle = 0.22 # seconds per game turn: the game makes a turn every max_idle seconds, also if the player does nothing
+    max_catch_up = 5 # most turns in one frame. If frames are slower, the game slows down instead of jumping
+    cache_dir = os.path.join("data", "cache") # prepared images, see load_images
+    max_atlas_files = 8 # image cache files in cache_dir, the least recently used are deleted
+    image_files = [os.path.join("data", f"pacman{number}.png") for number in range(1, 6)] + [
+                   os.path.join("data", f"{color}_ghost{number}.png")
+                   for color in ("blue", "green", "neon", "orange", "pink", "red") for number in range(1, 5)] + [
+                   os.path.join("data", "point_small.png")]
+    fps_interval = 0.5 # how many seconds between updates of the fps display
     images = {}
+    atlas = None # all images in one surface, see load_images
+    level = None # the cells of the maze, see Level
+    worldrect = None # the whole maze in pixels, at least as big as the screen
+    scroll = True # False: the whole maze is shown on the screen, cells are as big as possible (dirty_rects mode)
+    min_cell = 24 # smallest cell size in pixels if scroll is True. Larger mazes scroll with the camera
+    max_pill_sprites = 10000 # mazes with more cells have their pills painted on the background
+    asset_sets = Cache(4) # (cell_width, cell_height) -> Atlas of recently used window sizes
+    display_flags = pygame.DOUBLEBUF | pygame.RESIZABLE
     # --- player images ---
     images_east = []
     images_west = []
@@ -621,15 +1954,31 @@ class Viewer:
             self,
             width=800,
             height=600,
+            pill_sprites=True,
+            dirty_rects=False,
+            level=None,
+            ghost_mode="wander",
+            fps=60,
+            seed=None,
+            record=None,
+            profile=False,
+            trace=None,
     ):
+        """pill_sprites: if False, pills are painted on the background instead of being sprites
+           dirty_rects: if True, only the changed parts of the screen are redrawn and updated (see DirtyGroup)
+           level: a Level, the filename of a level file, or None for Game.cells
+           Mazes that do not fit on the screen scroll (see Camera). dirty_rects mode always shows the whole maze
+           ghost_mode: "wander", "chase" or "scatter", see Simulation
+           fps: frames per second, 0 for as many as possible. Game turns are independent of fps (see max_idle)
+           seed: seed of the game, None for a random seed. record: filename to save a Replay of the game when it ends
+           profile: show the time of every phase of a frame (see FrameProfiler). trace: filename for a Chrome trace
+        """
 
-        Viewer.width = width
-        Viewer.height = height
-        Viewer.screenrect = pygame.Rect(0, 0, width, height)
-        tiles_x = len(Game.cells[0])
-        tiles_y = len(Game.cells)
-        Viewer.cell_width = width // tiles_x
-        Viewer.cell_height = height // tiles_y
+        if level is None:
+            level = Level.from_cells(Game.cells)
+        Viewer.level = level if isinstance(level, Level) else Level.load(level)
+        Viewer.scroll = not dirty_rects
+        Viewer.set_geometry(width, height)
 
         # ---- pygame init
         pygame.init()
@@ -651,12 +2000,26 @@ class Viewer:
         for j in self.joysticks:
             j.init()
         self.screen = pygame.display.set_mode(
-            (self.width, self.height), pygame.DOUBLEBUF
+            (self.width, self.height), Viewer.display_flags
         )
         self.clock = pygame.time.Clock()
-        self.fps = 60
+        self.fps = fps
         self.playtime = 0.0
-        self.idle = 0 # how many seconds user did not gave a command
+        self.idle = 0 # seconds since the last turn: the time that the next turns have to catch up
+        self.pill_sprites = pill_sprites and Viewer.level.width * Viewer.level.height <= Viewer.max_pill_sprites
+        self.dirty_rects = dirty_rects
+        self.camera = Camera(width, height, Viewer.worldrect)
+        # ---- head up display ----
+        self.hud_points = HudText((15, 15), 22, value=self.points_text)
+        self.hud_fps = HudText((15, height), 12, anchor="bottomleft")
+        self.huds = (self.hud_points, self.hud_fps)
+        self.fps_time = -Viewer.fps_interval
+        self.sim = Simulation(Viewer.level, seed=seed, ghost_mode=ghost_mode)
+        self.record = record
+        self.replay = None
+        self.profiler = None
+        if profile or trace is not None:
+            self.profiler = FrameProfiler(overlay=profile, trace=trace, budget=1000 / (fps or 60))
 
         # ------ background images ------
         # self.backgroundfilenames = []  # every .jpg or .jpeg file in the folder 'data'
@@ -665,58 +2028,173 @@ class Viewer:
         self.setup() # this includes prepare_sprites()
         self.run()
 
+    @staticmethod
+    def set_geometry(width, height):
+        """window size and cell size. screenrect is changed in place, sprites and particles keep it as area"""
+        Viewer.width = width
+        Viewer.height = height
+        if Viewer.screenrect is None:
+            Viewer.screenrect = pygame.Rect(0, 0, width, height)
+        else:
+            Viewer.screenrect.size = (width, height)
+        min_cell = Viewer.min_cell if Viewer.scroll else 1
+        Viewer.cell_width = max(min_cell, width // Viewer.level.width)
+        Viewer.cell_height = max(min_cell, height // Viewer.level.height)
+        size = (max(width, Viewer.level.width * Viewer.cell_width), max(height, Viewer.level.height * Viewer.cell_height))
+        if Viewer.worldrect is None:
+            Viewer.worldrect = pygame.Rect((0, 0), size)
+        else:
+            Viewer.worldrect.size = size
+
     def load_images(self):
+        """set the images for the current cell size. The atlas is taken from asset_sets,
+           from the image cache file or made from the png files (see load_atlas)"""
+        cell_size = (Viewer.cell_width, Viewer.cell_height)
+        Viewer.atlas = Viewer.asset_sets.get(cell_size, lambda: Viewer.load_atlas(*cell_size))
+        images = Viewer.atlas.frames
+        Viewer.images_east[:] = images["east"]
+        Viewer.images_south[:] = images["south"]
+        Viewer.images_west[:] = images["west"]
+        Viewer.images_north[:] = images["north"]
+        Player.images = images["east"]
+        for color in ("blue", "green", "neon", "orange", "pink", "red"):
+            Viewer.__dict__[f"images_{color}"][:] = images[color]
+        Viewer.images["pill"] = images["pill"][0]
+
+    @staticmethod
+    def load_atlas(cell_width, cell_height):
+        """load the texture atlas from the image cache file, or make and save it (see make_images).
+           Only the max_atlas_files most recently used files are kept"""
+        filename = os.path.join(Viewer.cache_dir,
+                                f"atlas_{cell_width}x{cell_height}_{asset_hash(Viewer.image_files)}.bin")
+        try:
+            atlas = Atlas.load(filename)
+            os.utime(filename)  # recently used
+            return atlas
+        except (OSError, ValueError, KeyError):
+            atlas = Atlas.pack(Viewer.make_images(cell_width, cell_height))
+            try:
+                atlas.save(filename)
+                Viewer.prune_atlas_files()
+            except OSError:
+                pass  # no cache, load the png files again next time
+            return atlas
+
+    @staticmethod
+    def prune_atlas_files():
+        """delete the least recently used image cache files, keep max_atlas_files"""
+        files = [os.path.join(Viewer.cache_dir, name) for name in os.listdir(Viewer.cache_dir)
+                 if name.startswith("atlas_") and name.endswith(".bin")]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for filename in files[Viewer.max_atlas_files:]:
+            os.remove(filename)
+
+    @staticmethod
+    def make_images(cell_width, cell_height):
+        """load and scale all png files, returns dict: name -> list of images"""
+        images = {}
         # --- pacman ----
         # ----- PACMAN -----
         # 5 pacman-pictures, heading east
+        images["east"] = []
         for number in range(1,6):
             pic = pygame.image.load(os.path.join("data", f"pacman{number}.png"))
-            pic = pygame.transform.scale(pic, (Viewer.cell_width, Viewer.cell_height))
-            pic.convert_alpha()
-            Viewer.images_east.append(pic)
+            pic = pygame.transform.scale(pic, (cell_width, cell_height))
+            images["east"].append(pic.convert_alpha())
         # copy for 3 other cardinal directions
-        Player.images = Viewer.images_east[:]
         angles = (-90,-180,-270)
-        containers = (Viewer.images_south, Viewer.images_west, Viewer.images_north)
-        for i in (0,1,2):
-            for pic in Viewer.images_east:
-                containers[i].append(pygame.transform.rotate(pic, angles[i]))
+        for direction, angle in zip(("south", "west", "north"), angles):
+            images[direction] = [pygame.transform.rotate(pic, angle) for pic in images["east"]]
         # ----ghost----
         colors = ("blue", "green", "neon", "orange", "pink", "red")
-        for i in range(len(colors)):
+        for color in colors:
+            images[color] = []
             for number in range(1,5):
-                pic = pygame.image.load(os.path.join("data", f"{colors[i]}_ghost{number}.png"))
-                pic = pygame.transform.scale(pic, (Viewer.cell_width, Viewer.cell_height))
-                pic.convert_alpha()
-                Viewer.__dict__[f"images_{colors[i]}"].append(pic)
+                pic = pygame.image.load(os.path.join("data", f"{color}_ghost{number}.png"))
+                pic = pygame.transform.scale(pic, (cell_width, cell_height))
+                images[color].append(pic.convert_alpha())
 
         # --- pill ---
         pic = pygame.image.load(os.path.join("data", "point_small.png"))
-        pic = pygame.transform.scale(pic, (Viewer.cell_width, Viewer.cell_height))
-        pic.convert_alpha()
-        Viewer.images["pill"] = pic  # east
+        pic = pygame.transform.scale(pic, (cell_width, cell_height))
+        images["pill"] = [pic.convert_alpha()]
+        return images
 
 
     def setup(self):
         """call this to restart a game"""
         # ------ game variables -----
-
-        self.background = pygame.Surface((Viewer.width, Viewer.height))
-        self.background.fill((15, 15, 15))
-        # draw start and finish text in topleft / lowerright corners
-
-        # create labyrinth
-        for y, line in enumerate(Game.cells):
-            for x, char in enumerate(line):
-                if char == 1:
-                    pygame.draw.rect(self.background, (0,0,128), (x * Viewer.cell_width, y * Viewer.cell_height, Viewer.cell_width, Viewer.cell_height) )
+        self.sim.reset()
+        if self.record is not None:
+            self.replay = Replay.record(self.sim)
+        self.effects = rng_stream(self.sim.seed, "effects")  # random numbers for sparks
+        self.make_background()
         self.prepare_sprites()
+        self.create_pills()
         self.idle = 0
 
+    def make_background(self):
+        """new background chunks for the current cell size, they are painted when they are shown.
+           In dirty_rects mode, the chunks are also painted on one screen sized surface: background"""
+        self.chunks = ChunkedBackground(self.paint_cells, Viewer.cell_width, Viewer.cell_height)
+        self.compose_background()
+
+    def compose_background(self):
+        if self.dirty_rects:
+            self.background = pygame.Surface((Viewer.width, Viewer.height)).convert()
+            self.chunks.draw(self.background, self.camera.rect)
+
+    def paint_cells(self, surface, left, top, right, bottom):
+        """paint the cells from left, top to right - 1, bottom - 1 on surface: walls, and pills if they are no sprites.
+           Walls next to each other in a row are filled as one rect"""
+        surface.fill((15, 15, 15))
+        maze = self.sim.maze
+        right = min(right, maze.width)
+        bottom = min(bottom, maze.height)
+        for y in range(top, bottom):
+            start = None
+            for x in range(left, right + 1):
+                wall = x < right and maze.walls[y * maze.width + x]
+                if wall and start is None:
+                    start = x
+                elif not wall and start is not None:
+                    surface.fill((0, 0, 128), ((start - left) * Viewer.cell_width, (y - top) * Viewer.cell_height,
+                                               (x - start) * Viewer.cell_width, Viewer.cell_height))
+                    start = None
+        if not self.pill_sprites:
+            pills = self.sim.state.pills
+            Viewer.atlas.blits(surface, [("pill", 0, ((x - left) * Viewer.cell_width, (y - top) * Viewer.cell_height))
+                                         for y in range(top, bottom) for x in range(left, right)
+                                         if pills[y * maze.width + x]])
+
+    def resize(self, width, height):
+        """change the window size while playing: new cell size, images, background and pills"""
+        self.screen = pygame.display.set_mode((width, height), Viewer.display_flags)
+        Viewer.set_geometry(width, height)
+        self.camera.set_size(width, height)
+        self.load_images()
+        self.make_background()
+        if self.pill_sprites:
+            for p in self.pillgroup:
+                p.kill()
+            self.create_pills()
+        self.sync_sprites()
+        for monster in self.playergroup:
+            monster.create_image()
+        for monster in self.ghostgroup:
+            monster.create_image()
+        self.hud_fps.move((15, height))
+        if self.dirty_rects:
+            self.screen.blit(self.background, (0, 0))
+            self.allgroup.repaint_rect(Viewer.screenrect)
+
 
     def prepare_sprites(self):
         """painting on the surface and create sprites"""
-        Viewer.allgroup = pygame.sprite.LayeredUpdates()  # for drawing with layers
+        if self.dirty_rects:
+            Viewer.allgroup = DirtyGroup()  # for drawing with layers, only changed sprites
+        else:
+            Viewer.allgroup = CameraGroup(self.camera)  # for drawing with layers, only sprites near the camera
         Viewer.playergroup = pygame.sprite.Group()
         Viewer.ghostgroup = pygame.sprite.Group()
         Viewer.pillgroup = pygame.sprite.Group()  # GroupSingle
@@ -728,192 +2206,181 @@ class Viewer:
         Pill.groups = self.allgroup, self.pillgroup
         Ghost.groups = self.allgroup, self.ghostgroup
 
-        #self.player1 = Player(x=10, y=9, picture = Viewer.images["player1"])
-        for y, line in enumerate(Game.cells):
-            for x, char in enumerate(line):
-                if char == 0:
-                    Pill(x=x, y=y, picture=Viewer.images["pill"])
-                elif char == 2:
-                    self.player1 = Player(x=x, y=x, xx=x, yy=y )
-                    self.player1.startx = x
-                    self.player1.starty = y
-                elif char == 3:
-                    pass # nothing
-                # --- ghosts ---
-                elif char == 4:
-                    Ghost(x=x, y=y, animation_index = 0, images=Viewer.images_red,
-                          startx = x, starty = y)
-                elif char == 5:
-                    Ghost(x=x, y=y, animation_index = 1, images=Viewer.images_green,
-                          startx = x, starty = y)
-                elif char == 6:
-                    Ghost(x=x, y=y, animation_index = 2, images=Viewer.images_orange,
-                          startx = x, starty = y)
-                elif char == 7:
-                    Ghost(x=x, y=y, animation_index = 3, images=Viewer.images_pink,
-                          startx = x, starty = y)
-
-
-    def check_player_ghost_collision(self):
-        # ----- player vs. ghost:
-        for player in self.playergroup:
-            #crashgroup = pygame.sprite.spritecollide(player, self.ghostgroup, False, pygame.sprite.collide_rect)
-            for ghost in self.ghostgroup:
-                if player.x == ghost.x and player.y == ghost.y:
-                    Game.lives -= 1
-                    Flytext(pos=pygame.math.Vector2(player.pos.x, player.pos.y),
-                            text="you lost a life! -- press Space key",
-                            color=(200, 0, 0),
-                            max_age=10,
-                            fontsize=22)
-                    self.wait_for_space = True
-                    self.reset_monsters_and_player()
-                    if Game.lives == 0:
-                        Flytext(pos=pygame.math.Vector2(self.width // 2, self.height // 2),
-                                text="Game over  - press space to restart",
-                                color=(200, 0, 0),
-                                max_age=10,
-                                fontsize=44)
-                        Game.lives = 3
-                        Game.points = 0
-                        self.reset_monsters_and_player()
-                        # --- kill old pills ----
-                        for p in self.pillgroup:
-                            p.kill()
-                        # create new pills
-                        for y, line in enumerate(Game.cells):
-                            for x, char in enumerate(line):
-                                if char == 0:
-                                    Pill(x=x, y=y, picture=Viewer.images["pill"])
-
-
-
-                        # self.setup()
-                    # break
-                    return # only substract one life at max.
+        # sparks of eaten pills
+        if numpy is not None:
+            self.sparks = ParticleSystem.sparks(acceleration=0.95, area=Viewer.worldrect,
+                                                rng=numpy.random.default_rng(self.effects.getrandbits(64)))
+        else:
+            self.sparks = None
+        state = self.sim.state
+        self.player1 = Player(x=state.player.x, y=state.player.y, actor=state.player)
+        ghost_images = {4: Viewer.images_red, 5: Viewer.images_green,
+                        6: Viewer.images_orange, 7: Viewer.images_pink}
+        for actor in state.ghosts:
+            Ghost(x=actor.x, y=actor.y, animation_index = actor.number % 4,
+                  images=ghost_images[actor.kind], actor=actor)
+
+    def create_pills(self):
+        """one Pill sprite for each pill in the simulation, or paint the background again with all pills"""
+        state = self.sim.state
+        self.pill_at = {}  # cell index -> Pill sprite
+        if self.pill_sprites:
+            for i, pill in enumerate(state.pills):
+                if pill:
+                    self.pill_at[i] = Pill(x=i % state.width, y=i // state.width, picture=Viewer.images["pill"])
+        else:
+            self.chunks.clear()
+            self.compose_background()
+            if self.dirty_rects:
+                self.allgroup.repaint_rect(Viewer.screenrect)
+
+    def remove_pill(self, x, y):
+        """remove the picture of an eaten pill"""
+        pill = self.pill_at.pop(y * self.sim.state.width + x, None)
+        if pill is not None:
+            pill.kill()
+        else:
+            self.chunks.fill_cell(x, y, (15, 15, 15))
+            if self.dirty_rects:
+                rect = pygame.Rect(x * Viewer.cell_width, y * Viewer.cell_height,
+                                   Viewer.cell_width, Viewer.cell_height)
+                self.background.fill((15, 15, 15), rect)
+                self.allgroup.repaint_rect(rect)
 
     def debug_positions(self):
-        print("player:", self.player1.x, self.player1.y)
+        print("player:", self.sim.state.player.x, self.sim.state.player.y)
+        for actor in self.sim.state.ghosts:
+            print("ghost ", actor.number, "x", actor.x, "y", actor.y)
+
+    def sync_sprites(self):
+        """move the sprites to the cells of their simulation actors"""
+        for monster in self.playergroup:
+            monster.set_cell(monster.actor.x, monster.actor.y)
         for monster in self.ghostgroup:
-            print("ghost ", monster.number, "x", monster.x, "y", monster.y)
-
-    def move_monsters(self):
-        #print("---before first check ----")
-        #self.debug_positions()
-        self.check_player_ghost_collision()
-        #print("---move monsters ---")
-        for monster in self.ghostgroup:
-            monster.move_nesw()
-        self.check_player_ghost_collision()
-        #self.debug_positions()
-
-    def move_player(self, dx, dy):
-        #print("cell to go:", Game.cells[self.player1.y + dy][self.player1.x+dx])
-        
-        self.player1.xx += dx // 4
-        self.player1.yy += dy // 4
-        self.player1.pos.x += Viewer.cell_width * dx // 4
-        self.player1.pos.y += Viewer.cell_height * dy // 4
-        
-        if self.player1.xx % 4 == 0:
-            self.player1.x = self.player1.xx
-        if self.player1.yy % 4 == 0:
-            self.player1.y = self.player1.yy
-            
-        
-        if Game.cells[self.player1.y][self.player1.x] in (0,2):
+            monster.set_cell(monster.actor.x, monster.actor.y)
         # Player images
-            if dx == 0 and dy == -1:
-                Player.images = Viewer.images_north[:]
-            elif dx == 0 and dy == 1:
-                Player.images = Viewer.images_south[:]
-            elif dx == 1 and dy == 0:
-                Player.images = Viewer.images_east[:]
-            elif dx == -1 and dy == 0:
-                Player.images = Viewer.images_west[:]
-            # move monsters
-            self.move_monsters()
+        self.player1.images = Viewer.atlas.frames[self.sim.state.player.direction]
+
+    def handle_events(self, events):
+        """render what happened inside the simulation during one step"""
+        for event in events:
+            if event[0] == "pill":
+                x, y = event[1], event[2]
+                self.remove_pill(x, y)
+                if self.sparks is not None:
+                    self.sparks.emit_sparks((x * Viewer.cell_width + Viewer.cell_width // 2,
+                                             y * Viewer.cell_height + Viewer.cell_height // 2))
+                    continue
+                for _ in range(5):
+                    m = pygame.math.Vector2()
+                    a = self.effects.randint(0, 360)
+                    w = self.effects.randint(100, 150)
+                    m.from_polar((w, a))
+                    Spark(pos=pygame.math.Vector2(x * Viewer.cell_width + Viewer.cell_width // 2,
+                                                  y * Viewer.cell_height + Viewer.cell_height // 2),
+                          move=m,
+                          _layer=10,
+                          color=(200, 200, 200),
+                          max_age=0.8,
+                          angle=a,
+                          acceleration=0.95,
+                          )
+            elif event[0] == "life_lost":
+                Flytext(pos=pygame.math.Vector2(self.player1.pos.x - self.camera.rect.x,
+                                                self.player1.pos.y - self.camera.rect.y),
+                        text="you lost a life! -- press Space key",
+                        color=(200, 0, 0),
+                        max_age=10,
+                        fontsize=22)
+                self.wait_for_space = True
+            elif event[0] == "game_over":
+                Flytext(pos=pygame.math.Vector2(self.width // 2, self.height // 2),
+                        text="Game over  - press space to restart",
+                        color=(200, 0, 0),
+                        max_age=10,
+                        fontsize=44)
+                # --- kill old pills and create new pills ----
+                for p in self.pillgroup:
+                    p.kill()
+                self.create_pills()
 
     def play(self):
         # ------- pressed and released key ------
+        new_size = None
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 return False # running = False
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_q or event.key == pygame.K_ESCAPE:
-                    running = False
-                #if event.key == pygame.K_SPACE:
-                #    self.move_monsters()  # player does nothing, but monsters move
-                #    self.idle = 0
-                #if event.key == pygame.K_UP:
-                #    # check if north of player is free
-                #    self.move_player(0, -1)
-                #    self.idle = 0
-                #if event.key == pygame.K_DOWN:
-                #    self.move_player(0, 1)
-                #    self.idle = 0
-                #if event.key == pygame.K_LEFT:
-                #    self.move_player(-1, 0)
-                #    self.idle = 0
-                #if event.key == pygame.K_RIGHT:
-                #    self.move_player(1, 0)
-                #    self.idle = 0
-
-        if self.idle > Viewer.max_idle:
-            # automatic turn because player did nothing for too long
-            pressed_keys = pygame.key.get_pressed()
-            if pressed_keys[pygame.K_UP]:
-                self.move_player(0, -1)
-            if pressed_keys[pygame.K_DOWN]:
-                self.move_player(0, 1)
-            if pressed_keys[pygame.K_LEFT]:
-                self.move_player(-1, 0)
-            if pressed_keys[pygame.K_RIGHT]:
-                self.move_player(1, 0)
-            self.move_monsters()
-            self.idle = 0
+                    return False
+            if event.type == pygame.VIDEORESIZE:
+                new_size = (event.w, event.h)  # dragging sends many sizes, only the last one is used
+        if new_size is not None:
+            self.resize(*new_size)
+        if self.profiler is not None:
+            self.profiler.mark("events")
+
+        # ------- game turns at a fixed rate: one turn for every max_idle seconds ------
+        turns = 0
+        while self.idle >= Viewer.max_idle and not self.wait_for_space:
+            if turns == Viewer.max_catch_up:
+                # too slow to catch up: forget the missing turns
+                self.idle %= Viewer.max_idle
+                break
+            self.turn()
+            self.idle -= Viewer.max_idle
+            turns += 1
         # ------------ pressed keys ------
         # pressed_keys = pygame.key.get_pressed()
         # ------ mouse handler ------
         # click_left, click_middle, click_right = pygame.mouse.get_pressed()
         # click_oldleft, click_oldmiddle, click_oldright = click_left, click_middle, click_right
-        # ----------- collision detection ------------
-        # ----- player vs pill ------
-        for player in self.playergroup:
-            crashgroup = pygame.sprite.spritecollide(player, self.pillgroup, True, pygame.sprite.collide_rect)
-            # crashgroup_m = pygame.sprite.spritecollide(ship, crashgroup_r, True,  pygame.sprite.collide_mask)
-            for pill in crashgroup:
-                Game.points += 1
-                for _ in range(5):
-                    m = pygame.math.Vector2()
-                    a = random.randint(0, 360)
-                    w = random.randint(100, 150)
-                    m.from_polar((w, a))
-                    Spark(pos=pygame.math.Vector2(pill.pos.x, pill.pos.y),
-                          move=m,
-                          _layer=10,
-                          color=(200, 200, 200),
-                          max_age=0.8,
-                          angle=a,
-                          acceleration=0.95,
-                          )
-        # ---------------------------
         return True # running = True
 
 
-    def reset_monsters_and_player(self):
-        """teleport monsters and players back at start position"""
-        self.player1.x = self.player1.startx
-        self.player1.y = self.player1.starty
-        self.player1.pos = pygame.math.Vector2(self.player1.x * Viewer.cell_width + Viewer.cell_width // 2,
-                                               self.player1.y * Viewer.cell_height + Viewer.cell_height // 2)
-        for m in self.ghostgroup:
-            m.x = m.startx
-            m.y = m.starty
-            m.pos = pygame.math.Vector2(m.x * Viewer.cell_width + Viewer.cell_width // 2,
-                                        m.y * Viewer.cell_height + Viewer.cell_height // 2)
-
-
+    def turn(self):
+        """one game turn, with the arrow key that is pressed now"""
+        pressed_keys = pygame.key.get_pressed()
+        action = None
+        if pressed_keys[pygame.K_UP]:
+            action = "north"
+        elif pressed_keys[pygame.K_DOWN]:
+            action = "south"
+        elif pressed_keys[pygame.K_LEFT]:
+            action = "west"
+        elif pressed_keys[pygame.K_RIGHT]:
+            action = "east"
+        events = self.sim.step(action)
+        if self.replay is not None:
+            self.replay.add(action, self.sim.state)
+        self.sync_sprites()
+        self.handle_events(events)
+
+    def interpolate_sprites(self):
+        """draw player and ghosts between their last and their new cell, by the time since the last turn"""
+        alpha = 1 if self.wait_for_space else min(1, self.idle / Viewer.max_idle)
+        for monster in self.playergroup:
+            monster.interpolate(alpha)
+        for monster in self.ghostgroup:
+            monster.interpolate(alpha)
+
+    def write_hud(self):
+        """write points and fps on the screen. returns the rects of the texts"""
+        self.update_hud()
+        return [hud.draw(self.screen) for hud in self.huds]
+
+    def points_text(self):
+        """text of the points hud, bound to hud_points"""
+        state = self.sim.state
+        return f"lives: {state.lives} points: {state.points}  pills left: {state.pills_left}"
+
+    def update_hud(self):
+        """set the texts of the head up display, they are rendered only if changed"""
+        self.hud_points.refresh()
+        # -------- fps, changed only every fps_interval seconds -----------
+        if self.playtime - self.fps_time >= Viewer.fps_interval:
+            self.fps_time = self.playtime
+            self.hud_fps.set("fps: {:5.2f}".format(self.clock.get_fps()))
 
     def run(self):
         """The mainloop"""
@@ -929,15 +2396,17 @@ class Viewer:
                 color = (0,222,0),
                 max_age = 4,
                 )
+        pygame.display.set_caption("pac man")
         while running:
             milliseconds = self.clock.tick(self.fps)  #
             seconds = milliseconds / 1000
+            profiler = self.profiler
+            if profiler is not None:
+                profiler.start_frame()
             self.playtime += seconds
             self.idle += seconds
 
-            # ---------- clear all --------------
             # pygame.display.set_caption(f"player 1: {self.player1.deaths}   vs. player 2: {self.player2.deaths}")     #str(nesw))
-            self.screen.blit(self.background, (0, 0))
 
             # -------- events ------
             #for event in pygame.event.get():
@@ -950,42 +2419,93 @@ class Viewer:
             if not self.wait_for_space:
                 running = self.play()
             else:
+                self.idle = min(self.idle, Viewer.max_idle)  # the first turn comes at once after space
+                new_size = None
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
                          running = False
+                    if event.type == pygame.VIDEORESIZE:
+                        new_size = (event.w, event.h)
                     if event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_SPACE:
                             self.wait_for_space = False
                             #print("yeahhhhhh")
                             Flytext(text="let's go!")
-            # ----------- writing on screen ----------
-
-            # -------- write points ------------
-            surf, rect = Viewer.font.render(
-                text = f"lives: {Game.lives} points: {Game.points}  pills left: {len(self.pillgroup)}",
-                fgcolor = (215,215,215),
-                size=22
-            )
-            self.screen.blit(surf, (15, 15))
-            # -------- fps -----------
-            surf, rect = Viewer.font.render(
-                text="fps: {:5.2f}".format(self.clock.get_fps()),
-                fgcolor=(215, 215, 215),
-                size=12,
-            )
-            self.screen.blit(surf, (15, Viewer.height - rect.height))
+                if new_size is not None:
+                    self.resize(*new_size)
+                if profiler is not None:
+                    profiler.mark("events")
+            if profiler is not None:
+                profiler.mark("logic")
             # write angle of ship, angle to mouse
             # diff = pygame.math.Vector2(pygame.mouse.get_pos()-self.ship1.pos)
             # m = diff.as_polar()[1]
-            pygame.display.set_caption("pac man")
 
             # --------- update all sprites ----------------
             self.allgroup.update(seconds)
+            self.interpolate_sprites()
+            if self.sparks is not None:
+                self.sparks.update(seconds)
+            if profiler is not None:
+                profiler.mark("update")
+            overlay = profiler is not None and profiler.overlay
 
             # ---------- blit all sprites --------------
-            self.allgroup.draw(self.screen)
-            pygame.display.flip()
+            if self.dirty_rects:
+                # HUD text is erased by the group and written again over the sprites
+                self.update_hud()
+                for hud in self.huds:
+                    self.allgroup.repaint_rect(hud.old_rect)
+                    self.allgroup.repaint_rect(hud.rect)
+                if self.sparks is not None:
+                    for rect in self.sparks.rects:
+                        self.allgroup.repaint_rect(rect)
+                if overlay:
+                    for rect in profiler.rects:
+                        self.allgroup.repaint_rect(rect)
+                if profiler is not None:
+                    profiler.mark("hud")
+                rects = self.allgroup.draw(self.screen, self.background)
+                if self.sparks is not None:
+                    rects.extend(self.sparks.draw(self.screen))
+                if profiler is not None:
+                    profiler.mark("draw")
+                for hud in self.huds:
+                    hud.draw(self.screen)
+                if profiler is not None:
+                    profiler.mark("hud")
+                if overlay:
+                    rects.extend(profiler.draw(self.screen))
+                    profiler.mark("overlay")
+                pygame.display.update(rects)
+            else:
+                # ---------- clear all: background of the visible part of the maze --------------
+                self.camera.follow(self.player1.rect.center)
+                self.chunks.draw(self.screen, self.camera.rect)
+                if profiler is not None:
+                    profiler.mark("draw")
+                # ----------- writing on screen ----------
+                self.write_hud()
+                if profiler is not None:
+                    profiler.mark("hud")
+                self.allgroup.draw(self.screen)
+                if self.sparks is not None:
+                    self.sparks.draw(self.screen, self.camera.rect.topleft)
+                if profiler is not None:
+                    profiler.mark("draw")
+                if overlay:
+                    profiler.draw(self.screen)
+                    profiler.mark("overlay")
+                pygame.display.flip()
+            if profiler is not None:
+                profiler.mark("flip")
+                profiler.end_frame()
             # -----------------------------------------------------
+        if self.replay is not None:
+            self.replay.save(self.record)
+        if self.profiler is not None:
+            print("\n".join(self.profiler.report()))
+            self.profiler.close()
         pygame.mouse.set_visible(True)
         pygame.quit()
         # try:
@@ -996,6 +2516,12 @@ class Viewer:
 
 ## -------------------- functions --------------------------------
 
+def rng_stream(seed, name):
+    """random generator for one part of the game ("ghosts", "effects"...). The same seed and name give the same
+       numbers, and the streams of different names do not change each other"""
+    return random.Random(f"{seed}:{name}")
+
+
 def between(value, lower_limit=0, upper_limit=255):
     """makes sure a (color) value stays between a lower and a upper limit ( 0 and 255 )
 
@@ -1006,19 +2532,41 @@ def between(value, lower_limit=0, upper_limit=255):
     return lower_limit if value < lower_limit else upper_limit if value > upper_limit else value
 
 
+def asset_hash(filenames):
+    """short hash of name, size and modification time of the files. Changes when a file changes"""
+    h = hashlib.sha1()
+    for filename in filenames:
+        stat = os.stat(filename)
+        h.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return h.hexdigest()[:12]
+
+
+def merge_rects(rects):
+    """join overlapping rects, so that no area is in more than one rect of the returned list"""
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = rect.collidelist(merged)
+        while i > -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
 def cmp(a, b):
     """compares a with b, returns 1 if a > b, returns 0 if a==b and returns -1 if a < b"""
     return (a > b) - (a < b)
 
 
-def randomize_colors(color, by=30):
+def randomize_colors(color, by=30, rng=random):
     """randomize each color of a r,g,b tuple by the amount of +- by
-    while staying between 0 and 255
+    while staying between 0 and 255. rng: random.Random (or the random module)
     returns a color tuple"""
     r, g, b = color
-    r += random.randint(-by, by)
-    g += random.randint(-by, by)
-    b += random.randint(-by, by)
+    r += rng.randint(-by, by)
+    g += rng.randint(-by, by)
+    b += rng.randint(-by, by)
     r = between(r)  # 0<-->255
     g = between(g)
     b = between(b)
@@ -1034,9 +2582,8 @@ def write(background, text, x=50, y=150, color=(0, 0, 0),
     """
     if font_size is None:
         font_size = 24
-    font = pygame.font.SysFont(font_name, font_size, bold)
-    width, height = font.size(text)
-    surface = font.render(text, True, color)
+    surface = Text.render_sysfont(text, color, font_name, font_size, bold)
+    width, height = surface.get_size()
 
     if origin == "center" or origin == "centercenter":
         background.blit(surface, (x - width // 2, y - height // 2))
@@ -1060,7 +2607,22 @@ def write(background, text, x=50, y=150, color=(0, 0, 0),
 
 if __name__ == "__main__":
     # g = Game()
+    import argparse
+    parser = argparse.ArgumentParser(description="pac man")
+    parser.add_argument("level", nargs="?", help="level file, see Level")
+    parser.add_argument("--seed", type=int, help="seed of the game, to play the same game again")
+    parser.add_argument("--ghosts", default="wander", choices=Simulation.ghost_modes, help="ghost mode")
+    parser.add_argument("--record", metavar="FILE", help="save a replay of the game (see replay.py)")
+    parser.add_argument("--profile", action="store_true", help="show the time of every phase of a frame")
+    parser.add_argument("--trace", metavar="FILE", help="save the phases of all frames as Chrome trace json")
+    args = parser.parse_args()
     Viewer(
         width=1200,
         height=800,
+        level=args.level,
+        ghost_mode=args.ghosts,
+        seed=args.seed,
+        record=args.record,
+        profile=args.profile,
+        trace=args.trace,
     )
@@ -0,0 +1,40 @@
+"""
+replay a recorded game of pac man without window
+
+record a game with: python pacman.py --record game.replay
+play it again with: python replay.py game.replay [level file]
+
+The game is run as fast as possible and the checksums of the recording are compared.
+A checksum that differs means the game rules gave another result than in the recorded game.
+
+part of http://ThePythonGamebook.com
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pacman
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay a recorded game of pac man without window")
+    parser.add_argument("replay", help="file written by pacman.py --record")
+    parser.add_argument("level", nargs="?", help="level file of the recorded game, default: the built-in maze")
+    args = parser.parse_args()
+    replay = pacman.Replay.load(args.replay)
+    level = None if args.level is None else pacman.Level.load(args.level)
+    sim = replay.simulation(level)
+    start = time.perf_counter()
+    ticks = replay.play(sim)
+    seconds = time.perf_counter() - start
+    state = sim.state
+    print(f"{ticks} ticks in {seconds:.3f} seconds ({ticks / max(seconds, 1e-9):,.0f} ticks per second), "
+          f"{ticks // replay.interval} checksums ok")
+    print(f"seed: {replay.seed}  lives: {state.lives}  points: {state.points}  pills left: {state.pills_left}")
+
+
+if __name__ == "__main__":
+    main()